@@ -184,10 +184,12 @@ module "lambda_ai_food_stats_calculator" {
   lambda_function_key = var.ai_food_stats_calculator_lambda_s3_key
   api_gateway_arn     = module.api_gateway.api_gateway_arn
   api_gateway_paths   = ["ai_food_stats_calculator"]
+  rds_secret_arn      = var.rds_secret_arn
   layers              = [var.lambda_layer_arn]
   environment_variables = {
-    OPENAI_API_KEY  = var.openai_secret_arn
-    FRONTEND_ORIGIN = "*"
+    OPENAI_API_KEY     = var.openai_secret_arn
+    OPENAI_SECRET_NAME = var.openai_secret_arn
+    FRONTEND_ORIGIN    = "*"
   }
 }
 
@@ -2,6 +2,11 @@
 resource "aws_api_gateway_rest_api" "auth_api" {
   name        = "granimals-auth-api"
   description = "API for Cognito auth Lambda functions"
+
+  # Lets the Lambdas return gzip/br compressed bodies (isBase64Encoded).
+  # Request bodies then arrive base64-encoded too; every Lambda behind this
+  # API decodes them, and the MOCK OPTIONS integrations convert to text.
+  binary_media_types = ["*/*"]
 }
 
 # -------------------------------------------------------------------
@@ -219,6 +224,9 @@ resource "aws_api_gateway_integration" "cors_options_integration" {
   http_method = each.value.http_method
   type        = "MOCK"
 
+  # binary_media_types covers */*, so keep the preflight's mapping template on text
+  content_handling = "CONVERT_TO_TEXT"
+
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
   }
@@ -249,6 +257,8 @@ resource "aws_api_gateway_integration_response" "cors_options_integration_respon
   http_method = each.value.http_method
   status_code = aws_api_gateway_method_response.cors_options_response[each.key].status_code
 
+  content_handling = "CONVERT_TO_TEXT"
+
   response_parameters = {
     "method.response.header.Access-Control-Allow-Headers" = local.cors_headers
     "method.response.header.Access-Control-Allow-Methods" = local.cors_methods
@@ -1,42 +1,24 @@
 import json
 import os
 import base64
-import boto3
-import logging
+import urllib.error
 import urllib.request
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+import granimals_food_cache
+import granimals_log
+import granimals_metrics
+import granimals_secrets
+import granimals_units
 
-# Cache secrets for warm starts
-_cached_api_key = None
+OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1")
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
 
-def get_openai_key():
-    global _cached_api_key
-    if _cached_api_key:
-        return _cached_api_key
-
-    secret_name = os.environ.get("OPENAI_SECRET_NAME", "openai_key")
-    region = os.environ.get("AWS_REGION", "ap-south-1")
-
-    client = boto3.client("secretsmanager", region_name=region)
-    resp = client.get_secret_value(SecretId=secret_name)
-
-    if "SecretString" in resp:
-        val = resp["SecretString"]
-        try:
-            data = json.loads(val)
-            _cached_api_key = (
-                data.get("OPENAI_API_KEY")
-                or data.get("openai_api_key")
-                or data.get("api_key")
-            )
-        except Exception:
-            _cached_api_key = val
-    else:
-        _cached_api_key = base64.b64decode(resp["SecretBinary"]).decode("utf-8")
-
-    return _cached_api_key
+def get_openai_key(refresh=False):
+    # Fetched during INIT and cached with a TTL by granimals_secrets
+    api_key = granimals_secrets.openai_key(refresh=refresh)
+    if not api_key:
+        raise RuntimeError("OpenAI key not configured (set OPENAI_SECRET_NAME)")
+    return api_key
 
 def safe_json_extract(content: str):
     """Extract valid JSON even if wrapped in markdown fences."""
@@ -61,12 +43,10 @@ def call_chatgpt(prompt, inputs):
     Generic HTTPS call to OpenAI Chat Completions/Responses style.
     """
     api_key = get_openai_key()
-    api_base = os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1")
-    model = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
 
-    url = f"{api_base}/chat/completions"
+    url = f"{OPENAI_API_BASE}/chat/completions"
     body = {
-        "model": model,
+        "model": OPENAI_MODEL,
         "messages": [
             {"role": "system", "content": "You are a strict JSON API."},
             {
@@ -83,18 +63,32 @@ def call_chatgpt(prompt, inputs):
         "temperature": 0.2,
     }
 
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(body).encode("utf-8"),
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
+    def post(key):
+        req = urllib.request.Request(
+            url,
+            data=json.dumps(body).encode("utf-8"),
+            headers={
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=15) as resp:
+            return resp.read().decode("utf-8")
 
-    with urllib.request.urlopen(req, timeout=15) as resp:
-        raw = resp.read().decode("utf-8")
+    try:
+        with granimals_metrics.span("execute"):
+            raw = post(api_key)
+    except urllib.error.HTTPError as e:
+        if e.code != 401:
+            raise
+        # Key was probably rotated since it was cached: refresh once and retry
+        granimals_log.warning("openai_auth_failed_refreshing_key")
+        api_key = get_openai_key(refresh=True)
+        with granimals_metrics.span("execute"):
+            raw = post(api_key)
+
+    with granimals_metrics.span("fetch"):
         data = json.loads(raw)
         content = data["choices"][0]["message"]["content"]
         return safe_json_extract(content)
@@ -109,26 +103,138 @@ def parse_event(event):
     except Exception:
         return {}
 
-def response(status, body, origin):
+NUTRIENTS = ("calories", "carbs", "fats", "proteins", "fibre")
+
+def quantity_prompt(food, quantity, unit):
+    return (
+        "You are a nutrition assistant for Granimals. "
+        "Given a food item and its quantity, return the estimated nutritional values "
+        "in JSON format only. Do not include any extra fields.\n\n"
+        f"Food item: {food}\n"
+        f"Quantity: {quantity} {unit}\n\n"
+        "Respond strictly as:\n"
+        "{\n"
+        "  \"calories\": <number>,\n"
+        "  \"carbs\": <number>,\n"
+        "  \"fats\": <number>,\n"
+        "  \"proteins\": <number>,\n"
+        "  \"fibre\": <number>\n"
+        "}"
+    )
+
+def profile_prompt(food):
+    return (
+        "You are a nutrition assistant for Granimals. "
+        "Given a food item, return its estimated nutritional values per 100 g, "
+        "its density and the weight of one typical piece, in JSON format only. "
+        "Do not include any extra fields.\n\n"
+        f"Food item: {food}\n\n"
+        "Respond strictly as:\n"
+        "{\n"
+        "  \"calories\": <number per 100 g>,\n"
+        "  \"carbs\": <number per 100 g>,\n"
+        "  \"fats\": <number per 100 g>,\n"
+        "  \"proteins\": <number per 100 g>,\n"
+        "  \"fibre\": <number per 100 g>,\n"
+        "  \"density_g_per_ml\": <number, or null if it is not measured by volume>,\n"
+        "  \"piece_grams\": <grams in one piece, or null if it is not counted in pieces>\n"
+        "}"
+    )
+
+def is_profile(result):
+    return isinstance(result, dict) and all(
+        isinstance(result.get(k), (int, float)) and not isinstance(result.get(k), bool) for k in NUTRIENTS
+    )
+
+def scale_profile(profile, grams):
+    """Nutrients in `grams` of a food from its per-100 g profile."""
+    factor = grams / 100.0
+    return {k: round(float(profile[k]) * factor, 2) for k in NUTRIENTS}
+
+def food_stats(food, quantity, unit):
+    """
+    (result, (cache hit, tier)) for quantity x unit of food.
+
+    Convertible quantities (g/kg/oz/lb/ml/cup/tbsp/tsp/piece) are computed
+    from the food's per-100 g profile, fetched from the model once per food
+    and cached, so "200 g rice", "150 g rice" and "1 cup rice" share one
+    call. Anything else (a "bowl", "a handful", a piece of a food without a
+    known piece weight, a food the model gave no usable profile for) asks
+    the model for that exact quantity, cached per quantity as before.
+    """
+    if granimals_units.unit_kind(unit) and granimals_units.parse_quantity(quantity) is not None:
+        key = granimals_food_cache.profile_key(food, OPENAI_MODEL)
+        profile, tier = granimals_food_cache.lookup(key)
+        if not is_profile(profile):  # nothing cached, or an answer stored for "100 g" that isn't one
+            profile, tier = None, None
+        if profile is None:
+            profile = call_chatgpt(profile_prompt(food), {"input1": food, "input2": 100, "input3": "g"})
+            if is_profile(profile):
+                granimals_food_cache.store(key, profile)
+            else:
+                # Per-100 g figures can't stand in for this quantity: ask for it directly
+                granimals_log.debug("⚖️ No usable per-100 g profile, asking for the quantity directly", food=food)
+                profile = None
+        grams = None
+        if profile is not None:
+            try:
+                grams = granimals_units.to_grams(granimals_food_cache.normalize_food(food), quantity, unit, profile)
+            except ValueError as e:
+                granimals_log.debug("⚖️ Quantity not convertible, asking for it directly", food=food, reason=str(e))
+        if grams is not None:
+            granimals_metrics.set_property("cache", tier or "miss")
+            granimals_metrics.set_property("stats_source", "profile")
+            return scale_profile(profile, grams), (tier is not None, tier)
+
+    # Same food and quantity → same answer: served from cache without a model call
+    key = granimals_food_cache.normalize_key(food, quantity, unit, OPENAI_MODEL)
+    cached, tier = granimals_food_cache.lookup(key)
+    granimals_metrics.set_property("cache", tier or "miss")
+    granimals_metrics.set_property("stats_source", "quantity")
+    if cached is not None:
+        return cached, (True, tier)
+    result = call_chatgpt(quantity_prompt(food, quantity, unit), {"input1": food, "input2": quantity, "input3": unit})
+    if is_strict_result(result):
+        granimals_food_cache.store(key, result)
+    return result, (False, None)
+
+def is_strict_result(result):
+    """False for the fallback safe_json_extract() builds when the model ignored the format."""
+    return isinstance(result, dict) and "warning" not in (result.get("details") or {})
+
+def response(status, body, origin, cache=None):
+    with granimals_metrics.span("serialize"):
+        body = json.dumps(body)
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": origin,
+        "Access-Control-Allow-Headers": "content-type,authorization",
+        "Access-Control-Allow-Methods": "POST,OPTIONS",
+    }
+    if cache is not None:
+        # cache = (hit, tier): X-Cache: HIT / MISS, X-Cache-Tier: memory / postgres
+        hit, tier = cache
+        headers["X-Cache"] = "HIT" if hit else "MISS"
+        if tier:
+            headers["X-Cache-Tier"] = tier
+        headers["Access-Control-Expose-Headers"] = "X-Cache,X-Cache-Tier"
     return {
         "statusCode": status,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": origin,
-            "Access-Control-Allow-Headers": "content-type,authorization",
-            "Access-Control-Allow-Methods": "POST,OPTIONS",
-        },
-        "body": json.dumps(body),
+        "headers": headers,
+        "body": body,
     }
 
+@granimals_metrics.handler
 def lambda_handler(event, context):
-    logger.info({"event": event.get("requestContext", {})})
+    granimals_log.start(context)
+    granimals_log.debug("📥 Incoming request", request_context=event.get("requestContext", {}))
     origin = os.environ.get("FRONTEND_ORIGIN", "*")
 
     if event.get("requestContext", {}).get("http", {}).get("method") == "OPTIONS":
         return response(200, {"ok": True}, origin)
 
-    payload = parse_event(event)
+    with granimals_metrics.span("parse"):
+        payload = parse_event(event)
     input1 = payload.get("input1")
     input2 = payload.get("input2")
     input3 = payload.get("input3")
@@ -137,26 +243,9 @@ def lambda_handler(event, context):
     if missing:
         return response(400, {"error": f"Missing fields: {', '.join(missing)}"}, origin)
 
-    # Nutrition prompt
-    prompt = (
-        "You are a nutrition assistant for Granimals. "
-        "Given a food item and its quantity, return the estimated nutritional values "
-        "in JSON format only. Do not include any extra fields.\n\n"
-        f"Food item: {input1}\n"
-        f"Quantity: {input2} {input3}\n\n"
-        "Respond strictly as:\n"
-        "{\n"
-        "  \"calories\": <number>,\n"
-        "  \"carbs\": <number>,\n"
-        "  \"fats\": <number>,\n"
-        "  \"proteins\": <number>,\n"
-        "  \"fibre\": <number>\n"
-        "}"
-    )
-
     try:
-        result = call_chatgpt(prompt, {"input1": input1, "input2": input2, "input3": input3})
-        return response(200, result, origin)
+        result, cache = food_stats(input1, input2, input3)
+        return response(200, result, origin, cache=cache)
     except Exception as e:
-        logger.exception("chatgpt_call_failed")
+        granimals_log.exception("chatgpt_call_failed")
         return response(502, {"ok": False, "error": str(e)}, origin)
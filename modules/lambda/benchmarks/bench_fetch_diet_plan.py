@@ -0,0 +1,95 @@
+"""
+Round trips and latency of fetch_diet_plan() (one query per level) against
+fetch_diet_plan_aggregated() (single statement) for 4, 12 and 52 week plans.
+
+Runs against whatever database the DB_* / RDS_SECRET_ARN env vars point at.
+Seed data is inserted inside a transaction that is rolled back at the end.
+
+    cd modules/lambda && python -m benchmarks.bench_fetch_diet_plan
+"""
+import json
+import statistics
+import time
+import uuid
+
+import psycopg2.extensions
+
+import granimals_db
+from insert_diet_plan import insert_diet_plan, fetch_diet_plan, fetch_diet_plan_aggregated
+
+WEEKS = (4, 12, 52)
+DAYS_PER_WEEK = 7
+MEALS_PER_DAY = 5
+RUNS = 20
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    executes = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.executes += 1
+        return super().execute(query, vars)
+
+
+def make_plan(weeks):
+    return {
+        "diet_plan_id": str(uuid.uuid4()),
+        "category": "benchmark",
+        "support_staff_id": str(uuid.uuid4()),
+        "weeks": [{
+            "diet_week_id": str(uuid.uuid4()),
+            "week_number": w + 1,
+            "days": [{
+                "diet_day_id": str(uuid.uuid4()),
+                "diet_day_name": f"day {d + 1}",
+                "date_assigned": "2025-01-01",
+                "meals": [{
+                    "meal_type": "meal",
+                    "meal_id": f"m{m}",
+                    "meal_name": f"meal {m}",
+                    "calories": 400,
+                    "proteins": 20,
+                    "fibers": 5,
+                    "fats": 10,
+                    "time_of_meal": f"{8 + 3 * m:02d}:00",
+                    "status": "planned",
+                    "notes": ["benchmark"],
+                } for m in range(MEALS_PER_DAY)],
+            } for d in range(DAYS_PER_WEEK)],
+        } for w in range(weeks)],
+    }
+
+
+def measure(conn, fetch, diet_plan_id):
+    cursor = conn.cursor(cursor_factory=CountingCursor)
+    timings = []
+    for _ in range(RUNS):
+        CountingCursor.executes = 0
+        start = time.perf_counter()
+        result = fetch(cursor, diet_plan_id)
+        if isinstance(result, tuple):
+            result = result[0]  # (document, version) from the aggregated path
+        body = result if isinstance(result, str) else json.dumps(result)
+        timings.append((time.perf_counter() - start) * 1000)
+    cursor.close()
+    return CountingCursor.executes, statistics.median(timings), len(body)
+
+
+def main():
+    conn = granimals_db.get_connection()
+    try:
+        print(f"{'weeks':>5} {'mode':>10} {'round trips':>12} {'p50 ms':>9} {'bytes':>9}")
+        for weeks in WEEKS:
+            plan = make_plan(weeks)
+            with conn.cursor() as cur:
+                insert_diet_plan(cur, plan)
+            for name, fetch in (("nested", fetch_diet_plan), ("aggregated", fetch_diet_plan_aggregated)):
+                trips, p50, size = measure(conn, fetch, plan["diet_plan_id"])
+                print(f"{weeks:>5} {name:>10} {trips:>12} {p50:>9.2f} {size:>9}")
+    finally:
+        conn.rollback()
+        granimals_db.release(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Response-body time of pull_data_from_rds with rows encoded in Python (the
+default) against db_json, where Postgres renders the JSON, for 1k, 10k and
+100k row results.
+
+Runs against whatever database the DB_* / RDS_SECRET_ARN env vars point at.
+The seed table is created inside a transaction that is rolled back at the end.
+
+    cd modules/lambda && python -m benchmarks.bench_pull_json
+"""
+import json
+import statistics
+import time
+
+import granimals_db
+import granimals_catalog
+from pull_data_from_rds import request_shape, get_compiled, render, bind_params, fetch_body
+
+SIZES = (1_000, 10_000, 100_000)
+RUNS = 5
+
+SEED_SQL = """
+    CREATE TABLE bench_pull_rows (
+        id int PRIMARY KEY,
+        tier text NOT NULL,
+        client_id uuid NOT NULL,
+        name text,
+        calories numeric,
+        logged_at timestamptz,
+        eaten_on date,
+        details jsonb
+    );
+    INSERT INTO bench_pull_rows
+    SELECT i, CASE WHEN i <= 1000 THEN '1k' WHEN i <= 11000 THEN '10k' ELSE '100k' END,
+           md5(i::text)::uuid, 'meal ' || i, round((random() * 900)::numeric, 2),
+           now() - i * interval '1 minute', current_date - (i % 365),
+           jsonb_build_object('fibers', i % 7, 'notes', jsonb_build_array('benchmark', i))
+    FROM generate_series(1, 111000) AS i
+"""
+
+
+def measure(conn, compiled, params, db_json):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        body = fetch_body(conn.cursor(), compiled, params, db_json=db_json)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(body.encode("utf-8")), body
+
+
+def main():
+    conn = granimals_db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SEED_SQL)
+        granimals_catalog.load(conn)  # so the uncommitted seed table passes validation
+
+        print(f"{'rows':>7} {'mode':>8} {'p50 ms':>9} {'bytes':>11}")
+        for size in SIZES:
+            label = f"{size // 1000}k"
+            shape, values = request_shape({
+                "table_name": "bench_pull_rows", "lookup_field": "tier", "lookup_value": label
+            })
+            compiled = get_compiled(shape)
+            render(compiled, conn)
+            params = bind_params(compiled, values, (), None)
+
+            bodies = []
+            for name, db_json in (("python", False), ("db_json", True)):
+                p50, size_bytes, body = measure(conn, compiled, params, db_json)
+                bodies.append(json.loads(body))
+                print(f"{size:>7} {name:>8} {p50:>9.2f} {size_bytes:>11}")
+            if bodies[0] != bodies[1]:
+                print("⚠️ bodies differ")
+    finally:
+        conn.rollback()
+        granimals_db.release(conn)
+
+
+if __name__ == "__main__":
+    main()
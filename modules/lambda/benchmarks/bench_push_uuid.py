@@ -0,0 +1,138 @@
+"""
+Validation pass of the push handlers on 10k-row payloads: the old key-name
+heuristic (every key containing "id", 36 chars, four dashes → uuid.UUID)
+against catalog-driven normalization of uuid columns only, plus the cost of
+inserting each pass's output with execute_values. "catalog+obj" binds the
+uuid columns as uuid.UUID objects through register_uuid's adapter instead
+of canonical text.
+
+Runs against whatever database the DB_* / RDS_SECRET_ARN env vars point at.
+The seed table is created inside a transaction that is rolled back at the end.
+
+    cd modules/lambda && python -m benchmarks.bench_push_uuid
+"""
+import copy
+import statistics
+import time
+import uuid
+
+from psycopg2.extras import execute_values, register_uuid, Json
+
+import granimals_db
+import granimals_catalog
+from granimals_push import prepare, BATCH_PAGE_SIZE
+
+ROWS = 10_000
+RUNS = 5
+
+SEED_SQL = """
+    CREATE TABLE bench_push_rows (
+        id uuid PRIMARY KEY,
+        client_id uuid NOT NULL,
+        plan_id uuid,
+        external_id text,
+        provider text,
+        food_name text,
+        grams numeric,
+        details jsonb
+    )
+"""
+
+
+def payload():
+    return [{
+        "table_name": "bench_push_rows",
+        "data": [{
+            "id": str(uuid.uuid4()),
+            "client_id": str(uuid.uuid4()),
+            "plan_id": str(uuid.uuid4()) if i % 3 else None,
+            "external_id": str(uuid.uuid4()).upper(),  # uuid-looking text: stored as sent
+            "provider": "usda",
+            "food_name": f"food {i}",
+            "grams": i % 500,
+            "details": {"fibers": i % 7},
+        } for i in range(ROWS)]
+    }]
+
+
+def heuristic_prepare(inserts, results):
+    """The validation loop as it was before the catalog drove it."""
+    groups = {}
+    for item in inserts:
+        table_name = item["table_name"]
+        for row in item["data"]:
+            try:
+                for key, value in row.items():
+                    if (
+                        "id" in key.lower()
+                        and isinstance(value, str)
+                        and len(value) == 36
+                        and value.count("-") == 4
+                    ):
+                        row[key] = str(uuid.UUID(value))
+                granimals_catalog.require_columns(table_name, list(row.keys()))
+                columns = tuple(sorted(row))
+                types = granimals_catalog.column_types(table_name)
+                values = [
+                    Json(row[col]) if isinstance(row[col], (dict, list)) and types.get(col) == "jsonb" else row[col]
+                    for col in columns
+                ]
+                groups.setdefault((table_name, columns, None), []).append((len(results), values))
+                results.append({"table": table_name, "status": "pending"})
+            except ValueError as e:
+                results.append({"table": table_name, "status": "failed", "error": str(e)})
+    return groups
+
+
+def uuid_object_prepare(inserts, results):
+    groups = prepare(inserts, results)
+    adapters = granimals_catalog.table("bench_push_rows")["adapters"]
+    for (_, columns, _), rows in groups.items():
+        positions = [i for i, col in enumerate(columns) if adapters.get(col) == "uuid"]
+        for _, values in rows:
+            for i in positions:
+                if values[i] is not None:
+                    values[i] = uuid.UUID(values[i])
+    return groups
+
+
+def measure(conn, prepare_fn, inserts):
+    prepare_ms, insert_ms = [], []
+    for _ in range(RUNS):
+        batch = copy.deepcopy(inserts)  # the heuristic rewrites rows in place
+        start = time.perf_counter()
+        groups = prepare_fn(batch, [])
+        prepare_ms.append((time.perf_counter() - start) * 1000)
+
+        (table_name, columns, _), rows = next(iter(groups.items()))
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s"
+        with conn.cursor() as cur:
+            register_uuid(conn_or_curs=cur)
+            cur.execute("SAVEPOINT bench")
+            start = time.perf_counter()
+            execute_values(cur, query, [values for _, values in rows], page_size=BATCH_PAGE_SIZE)
+            insert_ms.append((time.perf_counter() - start) * 1000)
+            cur.execute("ROLLBACK TO SAVEPOINT bench")
+    return statistics.median(prepare_ms), statistics.median(insert_ms)
+
+
+def main():
+    conn = granimals_db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SEED_SQL)
+        granimals_catalog.load(conn)  # so the uncommitted seed table passes validation
+
+        inserts = payload()
+        print(f"{'pass':>11} {'prepare p50 ms':>15} {'insert p50 ms':>14}")
+        passes = (("heuristic", heuristic_prepare), ("catalog+obj", uuid_object_prepare), ("catalog", prepare))
+        for name, prepare_fn in passes:
+            prepare_p50, insert_p50 = measure(conn, prepare_fn, inserts)
+            print(f"{name:>11} {prepare_p50:>15.2f} {insert_p50:>14.2f}")
+    finally:
+        conn.rollback()
+        granimals_db.release(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import json
+import base64
 import boto3
 import os
 import secrets
@@ -16,7 +17,10 @@ def generate_secure_password(length=12):
 
 def lambda_handler(event, context):
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = event.get('body', '{}')
+        if event.get('isBase64Encoded'):  # binary media types are enabled on the API
+            body = base64.b64decode(body).decode('utf-8')
+        body = json.loads(body)
         email = body.get('username')  # consistent naming
 
         if not email:
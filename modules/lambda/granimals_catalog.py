@@ -0,0 +1,233 @@
+import os
+import re
+import time
+import uuid
+import threading
+
+import psycopg2
+import psycopg2.errors
+from psycopg2.extras import Json
+
+import granimals_db
+import granimals_log
+
+# ==========================================================
+# Schema catalog shared by the RDS-backed handlers
+#
+# Columns (with their types), foreign keys and unique keys of every table and view on the
+# search_path, loaded once per warm container. Requests naming an unknown
+# table or column are rejected from memory, without opening a connection.
+# Reloaded after CATALOG_TTL_SECONDS, early when a name is missing (it may
+# have just been created), and after Postgres reports a table or column the
+# catalog still lists (see invalidate()).
+# ==========================================================
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL_SECONDS", 900))
+# A miss reloads the catalog at most this often, so bad input can't turn
+# every request into a catalog query
+MISS_REFRESH_AFTER = float(os.environ.get("CATALOG_MISS_REFRESH_SECONDS", 30))
+
+COLUMNS_SQL = """
+    SELECT c.table_schema, c.table_name, c.column_name, c.data_type, c.udt_name,
+           c.is_nullable = 'YES', c.column_default
+    FROM information_schema.columns c
+    WHERE c.table_schema = ANY(current_schemas(false))
+    ORDER BY array_position(current_schemas(false), c.table_schema::name), c.table_name, c.ordinal_position
+"""
+
+FOREIGN_KEYS_SQL = """
+    SELECT n.nspname, src.relname, con.conname,
+           array_agg(sa.attname::text ORDER BY k.ord), dst.relname, array_agg(da.attname::text ORDER BY k.ord)
+    FROM pg_constraint con
+    JOIN pg_class src ON src.oid = con.conrelid
+    JOIN pg_namespace n ON n.oid = src.relnamespace
+    JOIN pg_class dst ON dst.oid = con.confrelid
+    CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(src_att, dst_att, ord)
+    JOIN pg_attribute sa ON sa.attrelid = con.conrelid AND sa.attnum = k.src_att
+    JOIN pg_attribute da ON da.attrelid = con.confrelid AND da.attnum = k.dst_att
+    WHERE con.contype = 'f' AND n.nspname = ANY(current_schemas(false))
+    GROUP BY n.nspname, src.relname, con.conname, dst.relname
+    ORDER BY src.relname, con.conname
+"""
+
+# Primary keys, unique constraints and plain unique indexes (no predicate or
+# expressions): the column sets ON CONFLICT can name as its arbiter
+UNIQUE_KEYS_SQL = """
+    SELECT n.nspname, t.relname, i.relname, array_agg(a.attname::text ORDER BY k.ord), x.indisprimary
+    FROM pg_index x
+    JOIN pg_class t ON t.oid = x.indrelid
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    CROSS JOIN LATERAL unnest(x.indkey::int2[]) WITH ORDINALITY AS k(att, ord)
+    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.att
+    WHERE x.indisunique AND x.indpred IS NULL AND x.indexprs IS NULL
+      AND k.ord <= x.indnkeyatts AND n.nspname = ANY(current_schemas(false))
+    GROUP BY n.nspname, t.relname, i.relname, x.indisprimary
+    ORDER BY t.relname, NOT x.indisprimary, i.relname
+"""
+
+# Column types whose values adapt_values() converts before binding
+ADAPTED_UDTS = {"json": "json", "jsonb": "json", "uuid": "uuid", "_uuid": "uuid[]"}
+CANONICAL_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# table -> {"schema", "columns": {column: {"type", "udt", "nullable", "default"}},
+#           "adapters": {column: kind}, "foreign_keys": [...], "unique_keys": [...]}
+_tables = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def load(conn):
+    """(Re)load the catalog over an open connection."""
+    global _tables, _loaded_at
+    tables = {}
+    with conn.cursor() as cur:
+        cur.execute(COLUMNS_SQL)
+        for schema, table_name, column, data_type, udt, nullable, default in cur.fetchall():
+            # Same name in several schemas: the first one on the search_path wins
+            entry = tables.setdefault(table_name, {
+                "schema": schema, "columns": {}, "adapters": {}, "foreign_keys": [], "unique_keys": []
+            })
+            if entry["schema"] == schema:
+                entry["columns"][column] = {"type": data_type, "udt": udt, "nullable": nullable, "default": default}
+                if udt in ADAPTED_UDTS:
+                    entry["adapters"][column] = ADAPTED_UDTS[udt]
+
+        cur.execute(FOREIGN_KEYS_SQL)
+        for schema, table_name, name, columns, ref_table, ref_columns in cur.fetchall():
+            entry = tables.get(table_name)
+            if entry is not None and entry["schema"] == schema:
+                entry["foreign_keys"].append({
+                    "name": name, "columns": columns, "ref_table": ref_table, "ref_columns": ref_columns
+                })
+
+        cur.execute(UNIQUE_KEYS_SQL)
+        for schema, table_name, name, columns, primary in cur.fetchall():
+            entry = tables.get(table_name)
+            if entry is not None and entry["schema"] == schema:
+                entry["unique_keys"].append({"name": name, "columns": columns, "primary": primary})
+
+    with _lock:
+        _tables, _loaded_at = tables, time.monotonic()
+    granimals_log.info("📚 Schema catalog loaded", tables=len(tables))
+    return tables
+
+
+def get_catalog(refresh=False):
+    """The whole catalog (table -> entry), loaded or refreshed as needed."""
+    if refresh or _tables is None or time.monotonic() - _loaded_at > CATALOG_TTL:
+        return granimals_db.run(load)
+    return _tables
+
+
+def invalidate():
+    """Forget the catalog (and the prepared statements built on it); the next lookup reloads it."""
+    global _tables
+    with _lock:
+        _tables = None
+    granimals_db.clear_prepared()
+
+
+def is_schema_error(error):
+    """
+    True for Postgres errors meaning the catalog is out of date: unknown
+    table/column, or a cached plan whose result type changed under it.
+    """
+    if isinstance(error, psycopg2.errors.FeatureNotSupported):
+        return "cached plan" in str(error)
+    return isinstance(error, (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedColumn))
+
+
+def _lookup(table_name, columns=()):
+    tables = get_catalog()
+    for attempt in (1, 2):
+        entry = tables.get(table_name.lower())
+        missing = [col for col in columns if entry is None or col.lower() not in entry["columns"]]
+        if entry is not None and not missing:
+            return entry, []
+        if attempt == 1 and time.monotonic() - _loaded_at > MISS_REFRESH_AFTER:
+            tables = get_catalog(refresh=True)
+    return entry, missing
+
+
+def table(table_name):
+    """Catalog entry for a table or view, or None if it doesn't exist."""
+    return _lookup(table_name)[0]
+
+
+def require_columns(table_name, columns=()):
+    """Raise ValueError unless the table (and every given column) exists; returns the entry."""
+    entry, missing = _lookup(table_name, columns)
+    if entry is None:
+        raise ValueError(f"Unknown table: {table_name}")
+    if missing:
+        raise ValueError(f"Unknown column(s) for {table_name}: {', '.join(missing)}")
+    return entry
+
+
+def column_types(table_name):
+    """{column: data_type} for a table, e.g. {"client_id": "uuid", "notes": "jsonb"}; {} if unknown."""
+    entry = table(table_name)
+    return {col: info["type"] for col, info in entry["columns"].items()} if entry else {}
+
+
+def foreign_keys(table_name):
+    """[{"name", "columns", "ref_table", "ref_columns"}, ...] declared on a table."""
+    entry = table(table_name)
+    return entry["foreign_keys"] if entry else []
+
+
+def unique_keys(table_name):
+    """[{"name", "columns", "primary"}, ...]: the primary key first, then unique constraints/indexes."""
+    entry = table(table_name)
+    return entry["unique_keys"] if entry else []
+
+
+def _to_uuid(value, column):
+    # Canonical text passes as-is; other spellings uuid.UUID accepts are normalized
+    if not isinstance(value, str) or CANONICAL_UUID.fullmatch(value):
+        return value
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        raise ValueError(f"Invalid UUID format for '{column}'") from None
+
+
+def _adapt(kind, value, column):
+    if kind == "json":
+        return Json(value) if isinstance(value, (dict, list)) else value
+    if kind == "uuid":
+        return _to_uuid(value, column)
+    if isinstance(value, list):
+        return [_to_uuid(v, column) for v in value]
+    return value
+
+
+def row_adapter(table_name, columns):
+    """
+    Function turning a {column: value} row into its values in the order of
+    columns, adapted to the column types. Only the table's json/jsonb and
+    uuid columns are touched:
+      - objects and lists bound for json/jsonb are sent as JSON (psycopg2
+        would otherwise reject a dict and turn a list into an ARRAY)
+      - strings bound for uuid / uuid[] are validated and normalized to
+        canonical text, raising ValueError if malformed (text binds faster
+        than uuid.UUID objects through register_uuid's adapter)
+    Build it once per column set and reuse it for every row.
+    """
+    entry = table(table_name)
+    adapters = entry["adapters"] if entry else {}
+    plan = [(i, adapters[col.lower()], col) for i, col in enumerate(columns) if col.lower() in adapters]
+
+    def adapt(row):
+        values = [row[col] for col in columns]
+        for i, kind, col in plan:
+            if values[i] is not None:
+                values[i] = _adapt(kind, values[i], col)
+        return values
+
+    return adapt
+
+
+def adapt_values(table_name, row, columns=None):
+    """Values of one row, adapted as row_adapter() does (columns default to the row's own)."""
+    return row_adapter(table_name, columns or list(row))(row)
@@ -0,0 +1,525 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+import granimals_log
+import granimals_metrics
+import granimals_querylog
+import granimals_secrets
+
+# ==========================================================
+# Shared PostgreSQL connection pool for the RDS-backed Lambdas
+#
+# The pool lives at module level so warm invocations reuse its connections
+# instead of paying TCP + TLS + auth on every request. A single invocation
+# can check out several connections at once (up to DB_POOL_MAX) for
+# concurrent or batched work.
+# ==========================================================
+CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 5))
+
+# Connections kept open between invocations (psycopg2 closes anything above
+# minconn when it is put back) and the hard cap per container.
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", 4))
+POOL_WAIT_TIMEOUT = float(os.environ.get("DB_POOL_WAIT_SECONDS", 10))
+
+# Connections are replaced once they reach this age, so credential rotation,
+# RDS Proxy pinning and server-side memory growth never live forever.
+MAX_LIFETIME = float(os.environ.get("DB_MAX_CONN_LIFETIME_SECONDS", 1800))
+# Connections idle longer than this are closed rather than reused.
+IDLE_RECYCLE_AFTER = float(os.environ.get("DB_IDLE_RECYCLE_SECONDS", 300))
+# A connection idle for longer than this gets a round-trip ping before reuse;
+# anything more recent is trusted on the local status checks alone.
+LIVENESS_PING_AFTER = float(os.environ.get("DB_LIVENESS_PING_SECONDS", 60))
+
+# Applied once, when a connection is first opened.
+SESSION_SETTINGS = {
+    "application_name": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "granimals"),
+    "statement_timeout": os.environ.get("DB_STATEMENT_TIMEOUT_MS", "30000"),
+    "idle_in_transaction_session_timeout": os.environ.get("DB_IDLE_IN_TX_TIMEOUT_MS", "60000"),
+}
+
+_pool = None
+_slots = threading.BoundedSemaphore(POOL_MAX)
+_lock = threading.Lock()
+_conn_meta = {}  # id(conn) -> {"pool", "born", "last_used"}
+_stats = {
+    "checkouts": 0,
+    "waits": 0,
+    "connects": 0,
+    "reconnects": 0,
+    "recycled": 0,
+    "in_use": 0,
+    "prepared_hits": 0,
+    "prepared_misses": 0,
+    "prepared_evictions": 0,
+}
+
+
+class TimedCursor(extensions.cursor):
+    """
+    Default cursor of pooled connections: statements count as "execute", row
+    transfers as "fetch", and every statement is reported to the connection's
+    query log (granimals_querylog) when it has one.
+    """
+    timestamp = None
+    label = None  # set by logged_as(): statement text to report instead of what was sent
+
+    def _log(self, statement):
+        log = getattr(self.connection, "log", None)
+        text = self.label or statement
+        if log is not None and text:
+            log(text, self)
+
+    def execute(self, query, vars=None):
+        self.timestamp = time.time()
+        try:
+            with granimals_metrics.span("execute"):
+                return super().execute(query, vars)
+        finally:
+            self._log(self.query)
+
+    def executemany(self, query, vars_list):
+        self.timestamp = time.time()
+        try:
+            with granimals_metrics.span("execute"):
+                return super().executemany(query, vars_list)
+        finally:
+            self._log(self.query)
+
+    def copy_expert(self, sql, file, size=8192):
+        self.timestamp = time.time()
+        try:
+            with granimals_metrics.span("execute"):
+                return super().copy_expert(sql, file, size)
+        finally:
+            self._log(sql)
+
+    def fetchone(self):
+        with granimals_metrics.span("fetch"):
+            return super().fetchone()
+
+    def fetchmany(self, size=None):
+        with granimals_metrics.span("fetch"):
+            return super().fetchmany(self.arraysize if size is None else size)
+
+    def fetchall(self):
+        with granimals_metrics.span("fetch"):
+            return super().fetchall()
+
+    def __iter__(self):
+        # itersize rows per round trip, as plain iteration of a named cursor does
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+
+def _bump(counter, by=1):
+    with _lock:
+        _stats[counter] += by
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None or _pool.closed:
+            creds = granimals_secrets.rds_credentials()
+            granimals_log.info("🌐 Opening DB pool", host=creds["host"], dbname=creds["dbname"])
+            _pool = ThreadedConnectionPool(
+                POOL_MIN, POOL_MAX, connect_timeout=CONNECT_TIMEOUT, cursor_factory=TimedCursor,
+                connection_factory=granimals_querylog.connection_factory(), **creds
+            )
+        return _pool
+
+
+def _configure(conn):
+    names = list(SESSION_SETTINGS)
+    if names:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT " + ", ".join(["set_config(%s, %s, false)"] * len(names)),
+                [v for name in names for v in (name, str(SESSION_SETTINGS[name]))]
+            )
+        conn.commit()
+
+
+def _ping(conn):
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def _recycle_reason(conn, meta, now):
+    if conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return "dead"
+    if now - meta["born"] > MAX_LIFETIME:
+        return "max lifetime"
+    idle = now - meta["last_used"]
+    if idle > IDLE_RECYCLE_AFTER:
+        return "idle"
+    if idle > LIVENESS_PING_AFTER and not _ping(conn):
+        return "dead"
+    return None
+
+
+def _reset(conn):
+    """Drop whatever transaction/session state the previous request left behind."""
+    if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+    if conn.autocommit:
+        conn.autocommit = False
+
+
+def _drop(conn):
+    meta = _conn_meta.pop(id(conn), None)
+    owner = meta["pool"] if meta else None
+    try:
+        if owner is not None and not owner.closed:
+            owner.putconn(conn, close=True)
+    except PoolError:
+        pass
+    if not conn.closed:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _is_auth_failure(error):
+    message = str(error).lower()
+    return "password authentication failed" in message or "pam authentication failed" in message
+
+
+def _checkout():
+    pool = _get_pool()
+    while True:
+        conn = pool.getconn()
+        now = time.monotonic()
+        meta = _conn_meta.get(id(conn))
+
+        if meta is None:
+            _conn_meta[id(conn)] = {"pool": pool, "born": now, "last_used": now}
+            try:
+                _configure(conn)
+            except Exception:
+                _drop(conn)
+                raise
+            _bump("connects")
+            return conn
+
+        reason = _recycle_reason(conn, meta, now)
+        if reason is None:
+            _reset(conn)
+            meta["last_used"] = now
+            return conn
+
+        granimals_log.info("♻️ Recycling DB connection", reason=reason)
+        _bump("reconnects" if reason == "dead" else "recycled")
+        _drop(conn)
+
+
+def get_connection():
+    """Check a connection out of the pool, in a clean state and known to be usable."""
+    with granimals_metrics.span("connect"):
+        return _get_connection()
+
+
+def _get_connection():
+    if not _slots.acquire(blocking=False):
+        _bump("waits")
+        if not _slots.acquire(timeout=POOL_WAIT_TIMEOUT):
+            raise PoolError("Timed out waiting for a free DB connection")
+    try:
+        try:
+            conn = _checkout()
+        except psycopg2.OperationalError as e:
+            if not _is_auth_failure(e):
+                raise
+            # Most likely the secret was rotated under us: refresh once and reconnect
+            granimals_log.warning("🔑 DB authentication failed, refreshing credentials and reconnecting")
+            granimals_secrets.rds_credentials(refresh=True)
+            close_all()
+            _bump("reconnects")
+            conn = _checkout()
+    except Exception:
+        _slots.release()
+        raise
+    _bump("checkouts")
+    _bump("in_use")
+    return conn
+
+
+def release(conn, discard=False):
+    """Return a connection to the pool; broken ones (or discard=True) are closed."""
+    try:
+        meta = _conn_meta.get(id(conn))
+        if discard or meta is None or meta["pool"].closed or conn.closed:
+            _drop(conn)
+            return
+        try:
+            _reset(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            _drop(conn)
+            return
+
+        meta["last_used"] = time.monotonic()
+        meta["pool"].putconn(conn)
+        if conn.closed:
+            # Above POOL_MIN the pool closes surplus connections itself
+            _conn_meta.pop(id(conn), None)
+    finally:
+        _bump("in_use", -1)
+        _slots.release()
+
+
+@contextmanager
+def logged_as(cur, text):
+    """
+    Report the statements run in this block to the query log as text (a
+    template such as "INSERT ... VALUES %s") instead of what was sent;
+    spares fingerprinting every page of a bulk insert.
+    """
+    previous = getattr(cur, "label", None)
+    if isinstance(cur, TimedCursor):
+        cur.label = text
+    try:
+        yield cur
+    finally:
+        if isinstance(cur, TimedCursor):
+            cur.label = previous
+
+
+@contextmanager
+def connection():
+    """with connection() as conn: ... -- checkout/release around a block."""
+    conn = get_connection()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = bool(conn.closed)
+        raise
+    finally:
+        release(conn, discard=broken)
+
+
+def run(work):
+    """
+    Call work(conn) on a pooled connection and return its result.
+
+    If the connection turns out to be broken (server restart, idle timeout,
+    failover) the work is retried once on a fresh connection.
+    """
+    for attempt in (1, 2):
+        conn = get_connection()
+        broken = False
+        try:
+            return work(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = bool(conn.closed)
+            if attempt == 2 or not broken:
+                raise
+            granimals_log.warning("♻️ DB connection lost mid-request, retrying on a fresh one")
+            _bump("reconnects")
+        finally:
+            release(conn, discard=broken)
+
+
+# ==========================================================
+# Per-connection prepared statement cache
+#
+# Generated queries with the same shape produce the same SQL text, so warm
+# connections PREPARE each text once and EXECUTE it afterwards, skipping
+# parse/analyze (and planning, once Postgres settles on a generic plan).
+# Disable with DB_PREPARED_STATEMENTS=0 when going through RDS Proxy, where
+# PREPARE pins the client to one backend connection.
+# ==========================================================
+PREPARED_ENABLED = os.environ.get("DB_PREPARED_STATEMENTS", "1") != "0"
+PREPARED_CACHE_SIZE = int(os.environ.get("DB_PREPARED_CACHE_SIZE", 64))
+
+_placeholder_pattern = re.compile(r"%%|%s|%\(")
+
+
+def _to_server_placeholders(sql):
+    """'... = %s' → '... = $1' (None if the text uses named placeholders)."""
+    count = 0
+
+    def number(match):
+        nonlocal count
+        token = match.group(0)
+        if token == "%%":
+            return "%"
+        if token == "%(":
+            raise ValueError("named placeholder")
+        count += 1
+        return f"${count}"
+
+    try:
+        return _placeholder_pattern.sub(number, sql), count
+    except ValueError:
+        return None, 0
+
+
+def _prepare(cur, cache, sql, params):
+    """PREPARE sql on this connection and cache its name; None if it can't be prepared."""
+    server_sql, count = _to_server_placeholders(sql)
+    if server_sql is None or count != len(params):
+        return None
+
+    name = "gr_" + hashlib.md5(sql.encode("utf-8")).hexdigest()[:20]
+    statements = []
+    while len(cache) >= PREPARED_CACHE_SIZE:
+        _, evicted = cache.popitem(last=False)
+        if evicted is not None:
+            statements.append(f"DEALLOCATE {evicted}")
+        _bump("prepared_evictions")
+
+    # The savepoint keeps a PREPARE failure (e.g. a parameter type that
+    # can't be inferred) from aborting the caller's transaction
+    statements += ["SAVEPOINT gr_prepare", f"PREPARE {name} AS {server_sql}", "RELEASE SAVEPOINT gr_prepare"]
+    try:
+        cur.execute("; ".join(statements))
+    except psycopg2.ProgrammingError as e:
+        granimals_log.warning("⚠️ Could not prepare statement, executing directly", error=str(e).strip())
+        cur.execute("ROLLBACK TO SAVEPOINT gr_prepare")
+        cache[sql] = None
+        return None
+    cache[sql] = name
+    _bump("prepared_misses")
+    return name
+
+
+def _execute(cur, name, sql, params):
+    # Query stats and the slow-query log show the statement, not EXECUTE gr_...
+    with logged_as(cur, sql):
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+
+def _is_stale_plan(error):
+    # 0A000 "cached plan must not change result type": a table the statement
+    # reads gained or lost columns after it was prepared
+    return isinstance(error, psycopg2.errors.FeatureNotSupported) and "cached plan" in str(error)
+
+
+def execute_prepared(cur, sql, params=()):
+    """
+    cur.execute(sql, params), but through a server-side prepared statement
+    cached on this connection (LRU, DB_PREPARED_CACHE_SIZE entries).
+    Falls back to a plain execute for anything that can't be prepared.
+
+    A statement invalidated by a schema change is deallocated and prepared
+    again once; that retry is only possible when the EXECUTE opened the
+    transaction, otherwise the error goes to the caller (with the stale
+    entry already evicted, so the next request succeeds).
+    """
+    conn = cur.connection
+    meta = _conn_meta.get(id(conn))
+    if not PREPARED_ENABLED or meta is None or conn.autocommit:
+        cur.execute(sql, params)
+        return
+
+    if meta.pop("prepared_stale", False):
+        # Catalog was invalidated since this connection last prepared anything
+        cur.execute("DEALLOCATE ALL")
+        meta["prepared"] = OrderedDict()
+    cache = meta.setdefault("prepared", OrderedDict())
+
+    if sql in cache:
+        cache.move_to_end(sql)
+        name = cache[sql]
+        if name is None:  # known not to prepare; don't retry every time
+            cur.execute(sql, params)
+            return
+        _bump("prepared_hits")
+    else:
+        name = _prepare(cur, cache, sql, params)
+        if name is None:
+            cur.execute(sql, params)
+            return
+
+    fresh_transaction = conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+    try:
+        _execute(cur, name, sql, params)
+    except psycopg2.Error as e:
+        if not _is_stale_plan(e):
+            raise
+        granimals_log.warning("♻️ Prepared statement outdated by a schema change, preparing it again", statement=name)
+        conn.rollback()
+        cache.pop(sql, None)
+        cur.execute(f"DEALLOCATE {name}")
+        if not fresh_transaction:
+            raise
+        name = _prepare(cur, cache, sql, params)
+        if name is None:
+            cur.execute(sql, params)
+            return
+        _execute(cur, name, sql, params)
+
+
+def clear_prepared():
+    """
+    Forget every connection's prepared statements (after a schema change);
+    each connection runs DEALLOCATE ALL before its next prepared execute.
+    """
+    for meta in list(_conn_meta.values()):
+        meta["prepared_stale"] = True
+
+
+def close_all():
+    """Close every pooled connection; the next checkout opens a new pool."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None and not pool.closed:
+        pool.closeall()
+    for key, meta in list(_conn_meta.items()):
+        if meta["pool"] is pool:
+            _conn_meta.pop(key, None)
+
+
+def pool_stats():
+    """Counters for this container's pool (checkouts, waits, reconnects, ...)."""
+    with _lock:
+        stats = dict(_stats)
+    stats["open"] = len(_conn_meta)
+    return stats
+
+
+# Counters added to each invocation's EMF line as db_<name>: how much they
+# grew since the previous invocation's flush
+REPORTED_STATS = (
+    "checkouts", "waits", "connects", "reconnects", "recycled",
+    "prepared_hits", "prepared_misses", "prepared_evictions",
+)
+_reported = {}
+
+
+def _report_stats():
+    stats = pool_stats()
+    for name in REPORTED_STATS:
+        granimals_metrics.count(f"db_{name}", stats[name] - _reported.get(name, 0))
+        _reported[name] = stats[name]
+    # Connections this container holds open once the invocation is done
+    granimals_metrics.count("db_pool_open", stats["open"])
+
+
+granimals_metrics.on_flush(_report_stats)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import granimals_db
+import granimals_log
+import granimals_metrics
+import granimals_units
+
+# ==========================================================
+# Two-tier cache for ai_food_stats_calculator results
+#
+# Keyed on the normalised (food, quantity, unit) plus the model, so
+# "Banana, 1, pieces" and "banana , 1.0, piece" are one entry. A food's
+# per-100 g nutrient profile is the entry for (food, 100, g): see
+# profile_key().
+#   1. in-process LRU (AI_CACHE_LRU_SIZE entries): free on a warm container
+#   2. Postgres table ai_food_stats_cache: shared by every container, so a
+#      cold one still gets hits; each hit bumps hits / last_hit_at
+# Entries expire AI_CACHE_TTL_SECONDS after they were stored. Only clean
+# model answers are stored, never the "did not return strict JSON" fallback.
+# Any failure of the persistent tier is logged and treated as a miss: the
+# cache can slow a request down by one round trip, never fail it.
+# ==========================================================
+LRU_SIZE = int(os.environ.get("AI_CACHE_LRU_SIZE", 1024))
+TTL_SECONDS = int(os.environ.get("AI_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+PERSISTENT = (
+    os.environ.get("AI_CACHE_PERSISTENT", "1") != "0"
+    and bool(os.environ.get("RDS_SECRET_ARN") or os.environ.get("DB_HOST"))
+)
+TABLE = "ai_food_stats_cache"
+
+CREATE_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        food        text        NOT NULL,
+        quantity    text        NOT NULL,
+        unit        text        NOT NULL,
+        model       text        NOT NULL,
+        result      jsonb       NOT NULL,
+        created_at  timestamptz NOT NULL DEFAULT now(),
+        expires_at  timestamptz NOT NULL,
+        hits        bigint      NOT NULL DEFAULT 0,
+        last_hit_at timestamptz,
+        PRIMARY KEY (food, quantity, unit, model)
+    )
+"""
+
+# One round trip reads a live entry and counts the hit
+LOOKUP_SQL = f"""
+    UPDATE {TABLE}
+    SET hits = hits + 1, last_hit_at = now()
+    WHERE food = %s AND quantity = %s AND unit = %s AND model = %s AND expires_at > now()
+    RETURNING result, extract(epoch FROM expires_at - now())
+"""
+
+STORE_SQL = f"""
+    INSERT INTO {TABLE} (food, quantity, unit, model, result, expires_at)
+    VALUES (%s, %s, %s, %s, %s::jsonb, now() + make_interval(secs => %s))
+    ON CONFLICT (food, quantity, unit, model) DO UPDATE
+    SET result = EXCLUDED.result, created_at = now(), expires_at = EXCLUDED.expires_at
+"""
+
+_lru = OrderedDict()  # key -> (result, expiry as time.time())
+_lock = threading.Lock()
+_table_ready = False
+
+
+def normalize_food(food):
+    return granimals_units.normalize_text(food).strip(" .,;")
+
+
+def normalize_key(food, quantity, unit, model):
+    """(food, quantity, unit, model) in the form used as the cache key."""
+    number = granimals_units.parse_quantity(quantity)
+    quantity = format(number.normalize(), "f") if number is not None else granimals_units.normalize_text(quantity)
+    return normalize_food(food), quantity, granimals_units.normalize_unit(unit), model
+
+
+def profile_key(food, model):
+    """Cache key of a food's per-100 g nutrient profile."""
+    return normalize_key(food, 100, "g", model)
+
+
+def _remember(key, result, ttl):
+    with _lock:
+        _lru[key] = (result, time.time() + ttl)
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _ensure_table(cur):
+    # Checked first: CREATE ... IF NOT EXISTS still needs CREATE on the schema
+    global _table_ready
+    if not _table_ready:
+        cur.execute("SELECT to_regclass(%s)", (TABLE,))
+        if cur.fetchone()[0] is None:
+            cur.execute(CREATE_TABLE_SQL)
+        _table_ready = True
+
+
+def _lookup_persistent(key):
+    def work(conn):
+        with conn.cursor() as cur:
+            _ensure_table(cur)
+            cur.execute(LOOKUP_SQL, key)
+            row = cur.fetchone()
+        conn.commit()
+        return row
+    return granimals_db.run(work)
+
+
+def lookup(key):
+    """(result, tier) for a live entry, tier "memory" or "postgres"; (None, None) on a miss."""
+    with _lock:
+        entry = _lru.get(key)
+        if entry is not None:
+            if entry[1] > time.time():
+                _lru.move_to_end(key)
+                granimals_metrics.count("cache_hits_memory")
+                return entry[0], "memory"
+            del _lru[key]
+
+    if PERSISTENT:
+        try:
+            row = _lookup_persistent(key)
+        except Exception as e:
+            granimals_log.warning("⚠️ Food stats cache lookup failed", error=str(e).strip())
+            row = None
+        if row is not None:
+            result, remaining = row
+            _remember(key, result, float(remaining))
+            granimals_metrics.count("cache_hits_postgres")
+            return result, "postgres"
+
+    granimals_metrics.count("cache_misses")
+    return None, None
+
+
+def store(key, result):
+    """Cache a model result in both tiers."""
+    _remember(key, result, TTL_SECONDS)
+    if not PERSISTENT:
+        return
+
+    def work(conn):
+        with conn.cursor() as cur:
+            _ensure_table(cur)
+            cur.execute(STORE_SQL, (*key, json.dumps(result), TTL_SECONDS))
+        conn.commit()
+
+    try:
+        granimals_db.run(work)
+    except Exception as e:
+        granimals_log.warning("⚠️ Food stats cache store failed", error=str(e).strip())
+
+
+def clear_memory():
+    """Empty the in-process tier (the persistent one is left alone)."""
+    with _lock:
+        _lru.clear()
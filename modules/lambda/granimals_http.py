@@ -0,0 +1,152 @@
+import os
+import json
+import gzip
+import base64
+import hashlib
+
+try:
+    import brotli  # optional, only when packaged with the function
+except ImportError:
+    brotli = None
+
+import granimals_log
+import granimals_metrics
+
+# ==========================================================
+# Shared API Gateway response helpers
+# ==========================================================
+# Bodies at least this large are compressed when the client accepts it
+COMPRESS_MIN_BYTES = int(os.environ.get("HTTP_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("HTTP_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("HTTP_BROTLI_QUALITY", 5))
+
+
+def request_body(event, default="{}"):
+    """
+    Request body text. The API treats every media type as binary (so
+    compressed responses go out as bytes), which means API Gateway hands
+    request bodies over base64-encoded.
+    """
+    body = (event or {}).get("body")
+    if body is None:
+        return default
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body).decode("utf-8")
+    return body
+
+
+
+def get_header(event, name):
+    """Case-insensitive request header lookup (API Gateway keeps the client's casing)."""
+    headers = (event or {}).get("headers") or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def make_etag(*parts):
+    """
+    Weak ETag hashed from its parts: the response body itself, or a version
+    token plus whatever identifies the resource (id, fetch mode, ...). A
+    body hash needs the body built first, so a match saves only the
+    transfer, not the query or the encoding. Weak because the same
+    representation may be sent with different content encodings.
+    """
+    digest = hashlib.md5("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(event, etag):
+    """True when the client's If-None-Match already names this ETag (weak comparison)."""
+    header = get_header(event, "If-None-Match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    return opaque(etag) in {opaque(tag) for tag in header.split(",")}
+
+
+def choose_encoding(event):
+    """Best content coding the client accepts ("br", "gzip") or None, from Accept-Encoding."""
+    header = get_header(event, "Accept-Encoding")
+    if not header:
+        return None
+    accepted = {}
+    for part in header.split(","):
+        coding, _, param = part.partition(";")
+        q = 1.0
+        param = param.strip()
+        if param.startswith("q="):
+            try:
+                q = float(param[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in offered:  # server preference breaks ties
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(resp, event):
+    """
+    Compress a proxy response body for this client if it accepts gzip/br
+    and the body is at least COMPRESS_MIN_BYTES. The compressed bytes go
+    out base64-encoded with isBase64Encoded set; API Gateway decodes them.
+    """
+    resp["headers"]["Vary"] = "Accept-Encoding"
+    body = resp["body"].encode("utf-8")
+    coding = choose_encoding(event)
+    if coding is None or len(body) < COMPRESS_MIN_BYTES:
+        return resp
+
+    if coding == "br":
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    granimals_log.debug("🗜️ Response compressed", encoding=coding, bytes=len(body), compressed_bytes=len(compressed))
+    granimals_metrics.count("response_bytes", len(body), unit="Bytes")
+    granimals_metrics.count("response_compressed_bytes", len(compressed), unit="Bytes")
+    granimals_metrics.set_property("content_encoding", coding)
+
+    resp["headers"]["Content-Encoding"] = coding
+    resp["body"] = base64.b64encode(compressed).decode("ascii")
+    resp["isBase64Encoded"] = True
+    return resp
+
+
+def response(status_code, body, etag=None, headers=None, event=None):
+    """
+    API Gateway proxy response. A str body is treated as already-encoded
+    JSON and passed through untouched; anything else goes through json.dumps.
+    Pass the request event to compress the body when the client accepts it.
+    """
+    out_headers = {"Content-Type": "application/json"}
+    if etag:
+        out_headers["ETag"] = etag
+    if headers:
+        out_headers.update(headers)
+    with granimals_metrics.span("serialize"):
+        resp = {
+            "statusCode": status_code,
+            "headers": out_headers,
+            "body": body if isinstance(body, str) else json.dumps(body),
+            "isBase64Encoded": False,
+        }
+        return compress(resp, event) if event is not None else resp
+
+
+def not_modified(etag):
+    """304 with an empty body: the client's cached copy is still current."""
+    return {"statusCode": 304, "headers": {"ETag": etag}, "body": ""}
@@ -0,0 +1,102 @@
+import json
+
+from psycopg2 import extensions
+
+# ==========================================================
+# JSON-ready result rows
+#
+# Typecasters registered on a cursor make psycopg2 hand rows back in the
+# shape they'll be serialized in, instead of allocating Decimal / datetime
+# objects that only get converted again on the way out:
+#   NUMERIC               -> float
+#   DATE, TIME, TIMESTAMP -> ISO 8601 text (same form as .isoformat())
+#   json, jsonb           -> RawJSON, the text Postgres sent, spliced into
+#                            the response as-is (never parsed or re-encoded)
+#
+# Scoped to the cursors that produce JSON output: pooled connections are
+# shared with code that still expects Decimal and datetime values.
+# ==========================================================
+NUMERIC_OIDS = (1700,)
+DATE_OIDS = (1082,)
+TIME_OIDS = (1083, 1266)         # time, timetz
+TIMESTAMP_OIDS = (1114, 1184)    # timestamp, timestamptz
+JSON_OIDS = (114, 3802)          # json, jsonb
+
+NUMERIC_ARRAY_OIDS = (1231,)
+DATE_ARRAY_OIDS = (1182,)
+TIME_ARRAY_OIDS = (1183, 1270)
+TIMESTAMP_ARRAY_OIDS = (1115, 1185)
+
+
+class RawJSON(str):
+    """JSON text straight from the database; row_encoder() emits it verbatim."""
+
+
+def _cast_numeric(value, cur):
+    return None if value is None else float(value)
+
+
+def _cast_date(value, cur):
+    return value
+
+
+def _cast_time(value, cur):
+    # Postgres writes offsets as +hh; isoformat() (and JavaScript) want +hh:mm
+    if value is not None and value[-3] in "+-":
+        value += ":00"
+    return value
+
+
+def _cast_timestamp(value, cur):
+    if value is None:
+        return None
+    return _cast_time(value.replace(" ", "T", 1), cur)
+
+
+def _cast_json(value, cur):
+    return None if value is None else RawJSON(value)
+
+
+NUMERIC = extensions.new_type(NUMERIC_OIDS, "GR_NUMERIC_FLOAT", _cast_numeric)
+DATE = extensions.new_type(DATE_OIDS, "GR_DATE_ISO", _cast_date)
+TIME = extensions.new_type(TIME_OIDS, "GR_TIME_ISO", _cast_time)
+TIMESTAMP = extensions.new_type(TIMESTAMP_OIDS, "GR_TIMESTAMP_ISO", _cast_timestamp)
+JSON = extensions.new_type(JSON_OIDS, "GR_JSON_RAW", _cast_json)
+
+CASTS = (
+    NUMERIC, DATE, TIME, TIMESTAMP, JSON,
+    extensions.new_array_type(NUMERIC_ARRAY_OIDS, "GR_NUMERIC_FLOAT_ARRAY", NUMERIC),
+    extensions.new_array_type(DATE_ARRAY_OIDS, "GR_DATE_ISO_ARRAY", DATE),
+    extensions.new_array_type(TIME_ARRAY_OIDS, "GR_TIME_ISO_ARRAY", TIME),
+    extensions.new_array_type(TIMESTAMP_ARRAY_OIDS, "GR_TIMESTAMP_ISO_ARRAY", TIMESTAMP),
+)
+
+
+def register_casts(cur):
+    """Install the JSON-ready typecasters on a cursor (or a whole connection)."""
+    for cast in CASTS:
+        extensions.register_type(cast, cur)
+
+
+def row_encoder(description, key_columns=0, cls=json.JSONEncoder):
+    """
+    Function turning a result row into the text of a JSON object keyed by
+    column name (a later duplicate name wins, as with dict(zip(...))).
+    The last key_columns columns are left out. RawJSON cells are copied
+    in verbatim; everything else goes through cls.
+    """
+    names = [col[0] for col in description[:len(description) - key_columns]]
+    encoder = cls()
+    if not any(col[1] in JSON_OIDS for col in description[:len(names)]):
+        return lambda row: encoder.encode(dict(zip(names, row)))
+
+    positions = {name: i for i, name in enumerate(names)}
+    keys = [(encoder.encode(name) + ": ", i) for name, i in positions.items()]
+
+    def encode(row):
+        return "{" + ", ".join(
+            key + (row[i] if isinstance(row[i], RawJSON) else encoder.encode(row[i]))
+            for key, i in keys
+        ) + "}"
+
+    return encode
@@ -0,0 +1,141 @@
+import os
+import re
+import sys
+import json
+import random
+import traceback
+from datetime import datetime, timezone
+
+# ==========================================================
+# Structured logging shared by the Lambdas
+#
+# One JSON object per line on stdout, so CloudWatch Logs Insights can filter
+# on the fields. LOG_LEVEL (DEBUG, INFO, WARNING, ERROR; default INFO) gates
+# what is written: a line below the level costs one comparison and nothing
+# is serialized. Payload dumps (events, bodies, query parameters) are logged
+# at DEBUG; with LOG_DEBUG_SAMPLE_RATE set, that fraction of invocations
+# logs at DEBUG in full (decided once per invocation, in start()).
+# Every field is redacted and truncated before it is encoded.
+# ==========================================================
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+LEVEL = LEVELS.get(os.environ.get("LOG_LEVEL", "INFO").upper(), LEVELS["INFO"])
+DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", 0))
+
+# Longer strings are cut, longer lists / objects keep their first items
+MAX_STRING = int(os.environ.get("LOG_MAX_STRING_CHARS", 2000))
+MAX_ITEMS = int(os.environ.get("LOG_MAX_ITEMS", 20))
+MAX_DEPTH = 6
+
+REDACTED = "[REDACTED]"
+# Values (anything but an object or list) under keys like these are never written...
+SECRET_KEY = re.compile(r"passw|pwd|secret|token|authorization|api[_-]?key|cookie|credential|private[_-]?key", re.I)
+# ...nor credentials embedded in text: bearer/basic headers, DSN passwords,
+# OpenAI keys, and secret-looking string or number members of JSON held as a
+# string (raw bodies; a string cut short may lack its closing quote)
+SECRET_TEXT = re.compile(r"((?:bearer|basic)\s+|password=|\bsk-)[^\s\"'&;,]+", re.I)
+SECRET_JSON_MEMBER = re.compile(
+    r'("[^"]*(?:passw|secret|token|api_?key)[^"]*"\s*:\s*)(?:"(?:[^"\\]|\\.)*"?|-?\d[\d.eE+-]*)', re.I
+)
+
+_context = {}  # fields added to every line of the current invocation (request_id, ...)
+_threshold = LEVEL
+
+
+def start(context=None, **fields):
+    """
+    Call first thing in each handler: tags every line with the request id
+    (and any extra fields) and makes this invocation's debug sampling decision.
+    """
+    global _threshold
+    _context.clear()
+    request_id = getattr(context, "aws_request_id", None)
+    if request_id:
+        _context["request_id"] = request_id
+    _context.update(fields)
+
+    _threshold = LEVEL
+    if LEVEL > LEVELS["DEBUG"] and DEBUG_SAMPLE_RATE > 0 and random.random() < DEBUG_SAMPLE_RATE:
+        _threshold = LEVELS["DEBUG"]
+        _context["debug_sampled"] = True
+
+
+def enabled(level):
+    """True if lines at this level are written in the current invocation."""
+    return LEVELS[level] >= _threshold
+
+
+def scrub(value, key=None, depth=0):
+    """Copy of value that is safe and cheap to log: secrets redacted, large values cut down."""
+    containers = (dict, list, tuple, set, frozenset)
+    if key is not None and not isinstance(value, containers) and SECRET_KEY.search(str(key)):
+        return REDACTED
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    if isinstance(value, str):
+        value = SECRET_TEXT.sub(lambda m: m.group(1) + REDACTED, value)
+        value = SECRET_JSON_MEMBER.sub(lambda m: f'{m.group(1)}"{REDACTED}"', value)
+        if len(value) > MAX_STRING:
+            return f"{value[:MAX_STRING]}… (+{len(value) - MAX_STRING} chars)"
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+
+    if isinstance(value, dict):
+        if depth >= MAX_DEPTH:
+            return "{…}"
+        items = list(value.items())
+        scrubbed = {str(k): scrub(v, k, depth + 1) for k, v in items[:MAX_ITEMS]}
+        if len(items) > MAX_ITEMS:
+            scrubbed["…"] = f"+{len(items) - MAX_ITEMS} more keys"
+        return scrubbed
+    if isinstance(value, containers):
+        if depth >= MAX_DEPTH:
+            return "[…]"
+        items = list(value)
+        scrubbed = [scrub(v, None, depth + 1) for v in items[:MAX_ITEMS]]
+        if len(items) > MAX_ITEMS:
+            scrubbed.append(f"… +{len(items) - MAX_ITEMS} more items")
+        return scrubbed
+
+    # Decimal, datetime, UUID, exceptions, ...
+    return scrub(str(value), key, depth)
+
+
+def log(level, msg, **fields):
+    """Write one JSON line if level is enabled; fields are scrubbed first."""
+    if LEVELS[level] < _threshold:
+        return
+    line = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "level": level,
+        "msg": msg,
+        **_context,
+    }
+    for key, value in fields.items():
+        line[key] = scrub(value, key)
+    sys.stdout.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+
+
+def debug(msg, **fields):
+    log("DEBUG", msg, **fields)
+
+
+def info(msg, **fields):
+    log("INFO", msg, **fields)
+
+
+def warning(msg, **fields):
+    log("WARNING", msg, **fields)
+
+
+def error(msg, **fields):
+    log("ERROR", msg, **fields)
+
+
+def exception(msg, **fields):
+    """error() with the exception being handled and its traceback attached."""
+    exc = sys.exc_info()[1]
+    if exc is not None:
+        fields.setdefault("error", str(exc))
+        fields.setdefault("traceback", traceback.format_exc())
+    log("ERROR", msg, **fields)
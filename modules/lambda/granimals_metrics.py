@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+# ==========================================================
+# Per-invocation latency metrics in CloudWatch Embedded Metric Format
+#
+# Handlers and the shared modules time their work with span(phase); the
+# phases are parse → secrets → connect → execute → fetch → serialize.
+# Span times are exclusive: a span nested in another (the secrets fetch
+# inside connect, the row fetches inside a streaming serialize loop) is
+# taken out of its parent, so the phases add up to the invocation's time.
+# Whatever no span covers is reported as "other", next to "total".
+#
+# flush() writes everything as one EMF JSON line on stdout at the end of
+# the invocation, which CloudWatch turns into metrics (namespace
+# METRICS_NAMESPACE, dimension Function) without any PutMetricData calls.
+# Spans recorded between invocations (the secrets fetched during INIT) are
+# reported by the next flush. Locally: capture stdout and json.loads the line.
+# ==========================================================
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Granimals")
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+FUNCTION = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+
+PHASES = ("parse", "secrets", "connect", "execute", "fetch", "serialize")
+
+_timings = {}      # phase -> exclusive ms
+_counters = {}     # name -> (value, unit)
+_properties = {}   # extra fields on the EMF line (not metrics)
+_started = None
+_flush_hooks = []  # called by handler() before each flush, e.g. the query summary
+_lock = threading.Lock()
+_local = threading.local()  # per-thread stack of open spans: [phase, ms spent in children]
+
+
+def start(context=None, **properties):
+    """Begin an invocation: its total runs from here, properties go on its EMF line."""
+    global _started
+    _started = time.perf_counter()
+    with _lock:
+        _properties.clear()
+        request_id = getattr(context, "aws_request_id", None)
+        if request_id:
+            _properties["request_id"] = request_id
+        _properties.update(properties)
+
+
+def record(phase, ms):
+    """Add ms to a phase directly (for time measured some other way)."""
+    with _lock:
+        _timings[phase] = _timings.get(phase, 0.0) + ms
+
+
+@contextmanager
+def span(phase):
+    """with span("execute"): ... -- time a block into a phase."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    frame = [phase, 0.0]
+    stack.append(frame)
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - began) * 1000
+        stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        record(phase, elapsed - frame[1])
+
+
+def count(name, value=1, unit="Count"):
+    """Add to a counter metric reported with this invocation."""
+    with _lock:
+        previous = _counters.get(name, (0, unit))[0]
+        _counters[name] = (previous + value, unit)
+
+
+def set_property(name, value):
+    """Attach a field (not a metric) to this invocation's EMF line, e.g. the query mode."""
+    with _lock:
+        _properties[name] = value
+
+
+def on_flush(hook):
+    """Have handler() call hook() at the end of every invocation, before the metrics flush."""
+    if hook not in _flush_hooks:
+        _flush_hooks.append(hook)
+
+
+def flush(**properties):
+    """
+    Write this invocation's metrics as one EMF line on stdout and reset.
+    Returns the document (None when METRICS_ENABLED=0).
+    """
+    global _started
+    with _lock:
+        timings, counters, props = dict(_timings), dict(_counters), dict(_properties)
+        _timings.clear()
+        _counters.clear()
+        _properties.clear()
+    started, _started = _started, None
+    if not ENABLED:
+        return None
+
+    metrics = {phase: (round(ms, 3), "Milliseconds") for phase, ms in timings.items()}
+    if started is not None:
+        total = (time.perf_counter() - started) * 1000
+        metrics["total"] = (round(total, 3), "Milliseconds")
+        metrics["other"] = (round(max(total - sum(timings.values()), 0.0), 3), "Milliseconds")
+    metrics.update(counters)
+
+    doc = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": [["Function"]],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()],
+            }],
+        },
+        "Function": FUNCTION,
+        **props,
+        **properties,
+    }
+    doc.update((name, value) for name, (value, _) in metrics.items())
+    sys.stdout.write(json.dumps(doc, default=str) + "\n")
+    return doc
+
+
+def handler(fn):
+    """
+    Decorator for lambda_handler: starts the invocation's metrics and
+    flushes them, with the response's status code, however it returns.
+    """
+    @functools.wraps(fn)
+    def wrapper(event, context):
+        start(context)
+        status = None
+        try:
+            resp = fn(event, context)
+            status = resp.get("statusCode") if isinstance(resp, dict) else None
+            return resp
+        finally:
+            for hook in _flush_hooks:
+                try:
+                    hook()
+                except Exception:
+                    pass  # reporting must never fail the invocation
+            count("errors", 1 if status is None or status >= 500 else 0)
+            flush(status_code=status)
+    return wrapper
@@ -0,0 +1,440 @@
+import io
+import json
+import os
+from collections import Counter
+from decimal import Decimal
+
+import psycopg2
+from psycopg2.extras import execute_values, Json
+
+import granimals_db
+import granimals_http
+import granimals_log
+import granimals_metrics
+import granimals_catalog
+
+# ==========================================================
+# Insert engine behind push_data_to_rds and push_onboarding_question
+#
+# Rows are validated first (results keep the request's order), then inserted
+# grouped by (table, column set): one multi-row INSERT per BATCH_PAGE_SIZE
+# rows, or COPY through a staging table for groups of COPY_THRESHOLD rows and
+# up. Every page / COPY runs under a savepoint; if it fails, its rows are
+# retried one at a time under their own savepoints so exactly the bad rows
+# are reported. The request's `transaction` option decides what is committed:
+#   autocommit      (default) each page is committed as soon as it is written;
+#                   every good row is kept, as with the old row-at-a-time loop
+#   per_item        one transaction: failed rows are rolled back to their
+#                   savepoint and the rest are committed together at the end
+#   all_or_nothing  one transaction: any failed row rolls back the whole request
+#
+# An item may also carry on_conflict, turning its rows into upserts:
+#   {"conflict_columns": [...], "action": "do_nothing" | "update", "update_columns": [...]}
+# conflict_columns must be a primary key / unique constraint of the table.
+# Each row's result then says whether it was "inserted", "updated" or "skipped".
+# ==========================================================
+# Rows per multi-row INSERT
+BATCH_PAGE_SIZE = int(os.environ.get("PUSH_BATCH_PAGE_SIZE", 500))
+# Groups at least this large are loaded with COPY instead (backfills)
+COPY_THRESHOLD = int(os.environ.get("PUSH_COPY_THRESHOLD", 5000))
+# Values _csv_field() can write as COPY input (plus None); bool is an int
+COPY_TYPES = (str, int, float, Decimal, Json)
+
+TRANSACTION_MODES = ("autocommit", "per_item", "all_or_nothing")
+DEFAULT_TRANSACTION = "autocommit"
+
+ROLLED_BACK_ERROR = "Rolled back: another row in this all_or_nothing request failed"
+
+
+def parse_request(event):
+    """
+    (inserts, transaction mode) from the request. The body is one
+    {"table_name", "data"} object, an array of them, or
+    {"transaction": ..., "inserts": [...]}; the mode may also come from the
+    ?transaction= query parameter.
+    """
+    body = json.loads(granimals_http.request_body(event, "[]"))
+    granimals_log.debug("📦 Parsed body", body=body)
+
+    mode = (event.get("queryStringParameters") or {}).get("transaction")
+    if isinstance(body, dict):
+        mode = body.get("transaction", mode)
+        inserts = body["inserts"] if isinstance(body.get("inserts"), list) else [body]
+    elif isinstance(body, list):
+        inserts = body
+    else:
+        raise ValueError("Invalid payload format. Must be object or array.")
+
+    mode = mode or DEFAULT_TRANSACTION
+    if mode not in TRANSACTION_MODES:
+        raise ValueError(f"Invalid transaction mode: {mode} (expected one of {', '.join(TRANSACTION_MODES)})")
+    return inserts, mode
+
+
+def conflict_spec(table_name, on_conflict):
+    """
+    Validate an item's on_conflict option against the table's unique keys.
+    Returns (conflict columns, action, update columns), or None without one.
+    """
+    if not on_conflict:
+        return None
+    if not isinstance(on_conflict, dict):
+        raise ValueError("on_conflict must be an object")
+
+    conflict_columns = on_conflict.get("conflict_columns")
+    action = on_conflict.get("action")
+    update_columns = on_conflict.get("update_columns") or []
+    if not conflict_columns or not isinstance(conflict_columns, list):
+        raise ValueError("on_conflict.conflict_columns must be a non-empty list")
+    if action not in ("do_nothing", "update"):
+        raise ValueError("on_conflict.action must be do_nothing or update")
+    if not isinstance(update_columns, list):
+        raise ValueError("on_conflict.update_columns must be a list")
+    if action == "update" and not update_columns:
+        raise ValueError("on_conflict.update_columns is required when action is update")
+    if action == "do_nothing" and update_columns:
+        raise ValueError("on_conflict.update_columns only applies when action is update")
+
+    granimals_catalog.require_columns(table_name, conflict_columns + update_columns)
+    target = {col.lower() for col in conflict_columns}
+    keys = granimals_catalog.unique_keys(table_name)
+    if not any(set(key["columns"]) == target for key in keys):
+        available = "; ".join("(" + ", ".join(key["columns"]) + ")" for key in keys) or "none"
+        raise ValueError(
+            f"on_conflict.conflict_columns ({', '.join(conflict_columns)}) must match a primary key "
+            f"or unique constraint of {table_name} (available: {available})"
+        )
+    return tuple(conflict_columns), action, tuple(update_columns)
+
+
+def _row_plan(table_name, row, spec):
+    """(sorted columns, row adapter) for rows with this row's keys, once they pass the checks."""
+    # ✅ Table/column check against the schema catalog
+    granimals_catalog.require_columns(table_name, list(row.keys()))
+    if spec:
+        present = {key.lower() for key in row}
+        missing = [col for col in spec[0] + spec[2] if col.lower() not in present]
+        if missing:
+            raise ValueError(f"on_conflict column(s) missing from row: {', '.join(missing)}")
+
+    columns = tuple(sorted(row))
+    return columns, granimals_catalog.row_adapter(table_name, columns)
+
+
+def prepare(inserts, results):
+    """
+    Validation pass. Rows that fail go straight into results; the rest get a
+    "pending" placeholder and are returned grouped as
+    {(table_name, sorted columns, conflict spec): [(results index, values), ...]}.
+    """
+    groups = {}
+    plans = {}  # (table_name, row keys, spec) -> _row_plan(); rows of a payload mostly share keys
+    for item in inserts:
+        table_name = item.get("table_name")
+        data = item.get("data", {})
+
+        granimals_log.debug("➡️ Processing insert", table=table_name)
+
+        if not table_name or not data:
+            error_msg = "Missing table_name or data"
+            granimals_log.warning("❌ Invalid insert item", table=table_name, error=error_msg)
+            results.append({
+                "table": table_name or "unknown",
+                "status": "failed",
+                "error": error_msg
+            })
+            continue
+
+        # Normalize → always a list of rows
+        rows = data if isinstance(data, list) else [data]
+
+        try:
+            spec = conflict_spec(table_name, item.get("on_conflict"))
+        except ValueError as e:
+            error_msg = str(e)
+            granimals_log.warning("❌ Invalid on_conflict", table=table_name, error=error_msg)
+            results.extend({"table": table_name, "status": "failed", "error": error_msg} for _ in rows)
+            continue
+
+        for row in rows:
+            try:
+                key = (table_name, tuple(row), spec)
+                plan = plans.get(key)
+                if plan is None:
+                    plan = plans[key] = _row_plan(table_name, row, spec)
+                columns, adapt = plan
+
+                # ✅ uuid columns (per the catalog) parsed and validated here
+                values = adapt(row)
+                groups.setdefault((table_name, columns, spec), []).append((len(results), values))
+                results.append({"table": table_name, "status": "pending"})
+
+            except Exception as e:
+                error_msg = str(e)
+                granimals_log.debug("❌ Row rejected", table=table_name, error=error_msg)
+                results.append({
+                    "table": table_name,
+                    "status": "failed",
+                    "error": error_msg
+                })
+    return groups
+
+
+def _attempt(cur, label, work):
+    """Run work() under a savepoint; on a database error undo it and return False."""
+    cur.execute("SAVEPOINT push_unit")
+    try:
+        work()
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT push_unit")
+        granimals_log.warning(f"⚠️ {label} failed", error=str(e).strip())
+        if granimals_catalog.is_schema_error(e):
+            granimals_catalog.invalidate()  # the catalog is out of date
+        return False
+    cur.execute("RELEASE SAVEPOINT push_unit")
+    return True
+
+
+def _conflict_clause(spec):
+    conflict_columns, action, update_columns = spec
+    target = ", ".join(conflict_columns)
+    if action == "do_nothing":
+        return f"ON CONFLICT ({target}) DO NOTHING"
+    assignments = ", ".join(f"{col} = EXCLUDED.{col}" for col in update_columns)
+    return f"ON CONFLICT ({target}) DO UPDATE SET {assignments}"
+
+
+def _upsert_page_query(table_name, columns, spec):
+    """
+    Multi-row upsert reporting what happened to each row. RETURNING alone
+    can't say which input row a result belongs to (DO NOTHING returns
+    nothing for skipped rows), so the rows go through a CTE carrying their
+    results index and are joined back on the conflict columns. The empty
+    SELECT from the table gives the VALUES list the table's column types.
+    """
+    fields = ", ".join(columns)
+    keys = spec[0]
+    return f"""
+        WITH v (push_index, {fields}) AS (
+            SELECT NULL::int, {fields} FROM {table_name} WHERE false
+            UNION ALL VALUES %s
+        ), ins AS (
+            INSERT INTO {table_name} ({fields}) SELECT {fields} FROM v ORDER BY push_index
+            {_conflict_clause(spec)}
+            RETURNING {", ".join(keys)}, (xmax = 0) AS push_inserted
+        )
+        SELECT v.push_index, ins.push_inserted, {", ".join("v." + key for key in keys)}
+        FROM v LEFT JOIN ins ON {" AND ".join(f"ins.{key} = v.{key}" for key in keys)}
+        ORDER BY v.push_index
+    """
+
+
+def _operations(rows):
+    """{results index: "inserted" | "updated" | "skipped"} from _upsert_page_query() rows."""
+    operations = {}
+    seen = set()
+    for index, inserted, *key in rows:
+        key = tuple(key)
+        if None in key:
+            operations[index] = "inserted"  # NULLs never conflict
+        elif inserted is None or key in seen:
+            # Conflicted (DO NOTHING), or repeats a key earlier in the page, which went in first
+            operations[index] = "skipped"
+        else:
+            operations[index] = "inserted" if inserted else "updated"
+            seen.add(key)
+    return operations
+
+
+def _success(table_name, operation=None):
+    result = {"table": table_name, "status": "success"}
+    if operation:
+        result["operation"] = operation
+    return result
+
+
+def _insert_rows(cur, table_name, columns, spec, rows, results):
+    """Row-at-a-time inserts, each under its own savepoint; False if any row failed."""
+    fields = ", ".join(columns)
+    row_query = f"INSERT INTO {table_name} ({fields}) VALUES ({', '.join(['%s'] * len(columns))})"
+    if spec:
+        row_query += f" {_conflict_clause(spec)} RETURNING (xmax = 0)"
+    ok = True
+    for index, values in rows:
+        cur.execute("SAVEPOINT push_row")
+        try:
+            with granimals_db.logged_as(cur, row_query):
+                cur.execute(row_query, values)
+            operation = None
+            if spec:
+                returned = cur.fetchone()
+                operation = "skipped" if returned is None else "inserted" if returned[0] else "updated"
+            cur.execute("RELEASE SAVEPOINT push_row")
+            results[index] = _success(table_name, operation)
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT push_row")
+            error_msg = str(e)
+            granimals_log.debug("❌ Insert failed", table=table_name, error=error_msg)
+            results[index] = {"table": table_name, "status": "failed", "error": error_msg}
+            ok = False
+    return ok
+
+
+def _csv_field(value):
+    # Unquoted empty is NULL in COPY's CSV format; anything quoted is a value
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, Json):
+        value = json.dumps(value.adapted)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _copy(cur, table_name, columns, rows):
+    """COPY the rows (CSV from an in-memory buffer) into a temp staging table, then INSERT ... SELECT."""
+    buffer = io.StringIO()
+    for _, values in rows:
+        buffer.write(",".join(map(_csv_field, values)) + "\n")
+    buffer.seek(0)
+
+    fields = ", ".join(columns)
+    granimals_log.info("📦 COPY through a staging table", table=table_name, rows=len(rows))
+    cur.execute(f"CREATE TEMP TABLE push_stage ON COMMIT DROP AS SELECT {fields} FROM {table_name} WITH NO DATA")
+    cur.copy_expert(f"COPY push_stage ({fields}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cur.execute(f"INSERT INTO {table_name} ({fields}) SELECT {fields} FROM push_stage")
+    # Dropped now rather than at commit: later groups in the same transaction reuse the name
+    cur.execute("DROP TABLE push_stage")
+
+
+def insert_group(conn, cur, table_name, columns, spec, rows, mode, results):
+    """
+    Insert rows that share a table, column set and on_conflict spec (rows is
+    [(results index, values), ...]). Large plain-insert groups try COPY
+    first; anything else, or a COPY that fails, goes in BATCH_PAGE_SIZE rows
+    at a time with execute_values. In autocommit mode each unit is committed
+    as it lands. Returns False once a row has failed in all_or_nothing mode,
+    leaving the rest of the group unattempted.
+    """
+    operations = {}
+
+    def done(unit):
+        for index, _ in unit:
+            results[index] = _success(table_name, operations.get(index))
+        granimals_log.debug("✅ Insert successful", table=table_name, rows=len(unit))
+        if mode == "autocommit":
+            conn.commit()
+
+    # Only scalars and Json are encoded for CSV (ARRAY literals aren't worth it, and
+    # anything else would go in as its repr), so other groups skip COPY; so do
+    # upserts, which need per-row outcomes
+    if (
+        not spec
+        and len(rows) >= COPY_THRESHOLD
+        and all(v is None or isinstance(v, COPY_TYPES) for _, values in rows for v in values)
+    ):
+        if _attempt(cur, f"COPY into {table_name}", lambda: _copy(cur, table_name, columns, rows)):
+            done(rows)
+            return True
+
+    if spec:
+        query = _upsert_page_query(table_name, columns, spec)
+    else:
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s"
+
+    def insert_page(page):
+        with granimals_db.logged_as(cur, query):
+            if spec:
+                batch = [(index, *values) for index, values in page]
+                operations.update(_operations(execute_values(cur, query, batch, page_size=len(batch), fetch=True)))
+            else:
+                execute_values(cur, query, [values for _, values in page], page_size=len(page))
+
+    for start in range(0, len(rows), BATCH_PAGE_SIZE):
+        page = rows[start:start + BATCH_PAGE_SIZE]
+        granimals_log.debug("📝 Executing query", query=query.strip(), rows=len(page))
+        if _attempt(cur, f"Batch insert into {table_name}", lambda: insert_page(page)):
+            done(page)
+            continue
+
+        granimals_log.info("🔁 Retrying rows one by one", table=table_name, rows=len(page))
+        ok = _insert_rows(cur, table_name, columns, spec, page, results)
+        if not ok and mode == "all_or_nothing":
+            return False
+        if mode == "autocommit":
+            conn.commit()
+    return True
+
+
+def push(inserts, mode=DEFAULT_TRANSACTION):
+    """Validate and insert every row; returns the per-row results, in request order."""
+    results = []
+    with granimals_metrics.span("parse"):
+        groups = prepare(inserts, results)
+    granimals_metrics.count("rows", len(results))
+    failed_early = any(r["status"] == "failed" for r in results)
+    ok = not (mode == "all_or_nothing" and failed_early)
+
+    if groups and ok:
+        # Warm connection reused across invocations. Not wrapped in
+        # granimals_db.run(): autocommit mode commits as it goes, so a blind
+        # retry could insert pages twice.
+        conn = granimals_db.get_connection()
+        cur = conn.cursor()
+        granimals_log.debug("✅ Database connection ready", transaction=mode)
+        try:
+            for (table_name, columns, spec), rows in groups.items():
+                ok = insert_group(conn, cur, table_name, columns, spec, rows, mode, results)
+                if not ok:
+                    break
+            if ok:
+                conn.commit()
+            else:
+                conn.rollback()
+                granimals_log.warning("↩️ all_or_nothing: a row failed, rolled back the whole request")
+        finally:
+            cur.close()
+            granimals_db.release(conn)
+
+    if not ok:
+        for i, result in enumerate(results):
+            if result["status"] in ("success", "pending"):
+                results[i] = {"table": result["table"], "status": "rolled_back", "error": ROLLED_BACK_ERROR}
+
+    # One summary line per request; per-row outcomes are DEBUG
+    granimals_log.info("📤 Push finished", transaction=mode, rows=len(results),
+                       **Counter(r["status"] for r in results))
+    return results
+
+
+def handle(event):
+    """The whole Lambda: parse, push, respond."""
+    try:
+        granimals_log.debug("📥 Incoming event", event=event)
+
+        try:
+            with granimals_metrics.span("parse"):
+                inserts, mode = parse_request(event)
+        except ValueError as e:
+            error_msg = str(e)
+            granimals_log.warning("❌ Invalid request", error=error_msg)
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"error": error_msg})
+            }
+
+        granimals_metrics.set_property("transaction", mode)
+        results = push(inserts, mode)
+        with granimals_metrics.span("serialize"):
+            return {
+                "statusCode": 200,
+                "body": json.dumps({"transaction": mode, "results": results})
+            }
+
+    except Exception as e:
+        error_msg = str(e)
+        granimals_log.exception("🔥 Fatal error in lambda_handler")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": error_msg})
+        }
@@ -0,0 +1,223 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from psycopg2 import extensions
+from psycopg2.extras import MinTimeLoggingConnection
+
+import granimals_log
+import granimals_metrics
+
+# ==========================================================
+# Query observability for the pooled connections
+#
+# Every statement run through a pooled connection is reduced to a
+# fingerprint: literals become ?, IN (...) / ARRAY[...] lists and multi-row
+# VALUES collapse to one entry, comments and whitespace are normalised. So
+# "WHERE id = 'a1'" and "WHERE id = 'b2'" are the same query, and so are
+# 3-item and 300-item IN lists.
+#
+# Per fingerprint the container keeps a latency histogram across warm
+# invocations, plus the calls and time of the current invocation. Queries
+# slower than DB_SLOW_QUERY_MS are logged as they finish; at the end of each
+# invocation flush() logs the DB_QUERY_TOP_N fingerprints that took the most
+# time. One fingerprint with hundreds of calls in a single invocation is an
+# N+1 loop.
+#
+# Built on psycopg2's MinTimeLoggingConnection: the pool creates
+# QueryLogConnection objects and the cursor (granimals_db.TimedCursor)
+# reports each statement to connection.log() with its start time.
+# ==========================================================
+ENABLED = os.environ.get("DB_QUERY_STATS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", 500))
+TOP_N = int(os.environ.get("DB_QUERY_TOP_N", 5))
+# Fingerprints tracked per container; the least recently seen are dropped
+MAX_FINGERPRINTS = int(os.environ.get("DB_QUERY_MAX_FINGERPRINTS", 500))
+
+# Histogram bucket upper bounds in ms; the last bucket is everything above
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_LITERALS = re.compile(
+    r"""\$(?P<tag>[A-Za-z_]*)\$.*?\$(?P=tag)\$"""   # dollar-quoted strings
+    r"""|[EeBbXx]?'(?:[^']|'')*'"""                 # strings, E'..', B'..', X'..'
+    r"""|(?<![\w$.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w$])"""  # numbers, not inside identifiers
+    r"""|(?<!\bIS )(?<!\bIS NOT )\b(?:NULL|TRUE|FALSE)\b""",       # keyword literals (not IS NULL)
+    re.S | re.I,
+)
+_PLACEHOLDERS = re.compile(r"%s|%\(\w+\)s|\$\d+")
+_WHITESPACE = re.compile(r"\s+")
+_VALUES_TEMPLATE = re.compile(r"\bVALUES \?(?![\w(])", re.I)
+_LISTS = re.compile(r"(\bIN\s*\(|\bARRAY\s*\[)\s*\?(?:\s*,\s*\?)*\s*(?=[)\]])", re.I)
+_ROWS = re.compile(r"\(\s*(?:\?|\.\.\.)(?:\s*,\s*(?:\?|\.\.\.))*\s*\)(?:\s*,\s*\(\s*(?:\?|\.\.\.)(?:\s*,\s*(?:\?|\.\.\.))*\s*\))+")
+
+_lock = threading.Lock()
+_fingerprints = OrderedDict()  # statement text -> (id, fingerprint), oldest dropped first
+_FINGERPRINT_CACHE = 256
+_stats = OrderedDict()         # fingerprint id -> container-wide histogram
+_invocation = {}               # fingerprint id -> {"calls", "ms", "max_ms", "rows"} for this invocation
+
+
+def fingerprint(statement):
+    """
+    (id, text) of a statement's normalised form; id is a short stable hash.
+
+        fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'")
+        → ("3f1c...", "SELECT * FROM t WHERE id IN (...) AND name = ?")
+    """
+    if isinstance(statement, bytes):
+        statement = statement.decode("utf-8", "replace")
+    cached = _fingerprints.get(statement)
+    if cached is not None:
+        return cached
+
+    text = _COMMENTS.sub(" ", statement)
+    text = _LITERALS.sub("?", text)
+    text = _PLACEHOLDERS.sub("?", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    text = _LISTS.sub(r"\1...", text)
+    text = _ROWS.sub("(...)", text)
+    text = _VALUES_TEMPLATE.sub("VALUES (...)", text)  # execute_values templates: "VALUES %s"
+    result = (hashlib.md5(text.encode("utf-8")).hexdigest()[:12], text)
+
+    # Long statements are mostly one-off bulk pages; only short texts are worth keeping
+    if len(statement) <= 4096:
+        with _lock:
+            _fingerprints[statement] = result
+            while len(_fingerprints) > _FINGERPRINT_CACHE:
+                _fingerprints.popitem(last=False)
+    return result
+
+
+def _bucket(ms):
+    for i, bound in enumerate(BUCKETS):
+        if ms <= bound:
+            return i
+    return len(BUCKETS)
+
+
+def percentile(hist, q):
+    """Upper bound (ms) of the bucket holding the q-th quantile of a histogram entry."""
+    target = q * hist["calls"]
+    seen = 0
+    for i, n in enumerate(hist["buckets"]):
+        seen += n
+        if n and seen >= target:
+            return BUCKETS[i] if i < len(BUCKETS) else hist["max_ms"]
+    return hist["max_ms"]
+
+
+def record(statement, ms, rows=-1):
+    """Account one statement's latency; logs it if it was slow. Returns the fingerprint id."""
+    fp_id, text = fingerprint(statement)
+    with _lock:
+        hist = _stats.pop(fp_id, None)
+        if hist is None:
+            hist = {"query": text, "calls": 0, "ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(BUCKETS) + 1)}
+        _stats[fp_id] = hist  # most recently seen last
+        while len(_stats) > MAX_FINGERPRINTS:
+            _stats.popitem(last=False)
+        hist["calls"] += 1
+        hist["ms"] += ms
+        hist["max_ms"] = max(hist["max_ms"], ms)
+        hist["buckets"][_bucket(ms)] += 1
+
+        current = _invocation.setdefault(fp_id, {"calls": 0, "ms": 0.0, "max_ms": 0.0, "rows": 0})
+        current["calls"] += 1
+        current["ms"] += ms
+        current["max_ms"] = max(current["max_ms"], ms)
+        if rows > 0:
+            current["rows"] += rows
+    granimals_metrics.count("queries")
+
+    if ms >= SLOW_QUERY_MS:
+        granimals_log.warning(
+            "🐢 Slow query", fingerprint=fp_id, query=text, ms=round(ms, 3), rows=rows,
+            threshold_ms=SLOW_QUERY_MS
+        )
+        if granimals_log.enabled("DEBUG"):
+            granimals_log.debug("🐢 Slow query statement", fingerprint=fp_id, statement=statement)
+    return fp_id
+
+
+def summary(limit=None):
+    """The current invocation's top fingerprints by total time, with their container-wide percentiles."""
+    limit = TOP_N if limit is None else limit
+    with _lock:
+        ranked = sorted(_invocation.items(), key=lambda item: item[1]["ms"], reverse=True)[:limit]
+        top = []
+        for fp_id, current in ranked:
+            hist = _stats.get(fp_id)
+            entry = {
+                "fingerprint": fp_id,
+                "calls": current["calls"],
+                "ms": round(current["ms"], 3),
+                "max_ms": round(current["max_ms"], 3),
+                "rows": current["rows"],
+            }
+            if hist is not None:
+                entry.update(
+                    query=hist["query"],
+                    container_calls=hist["calls"],
+                    p50_ms=percentile(hist, 0.5),
+                    p95_ms=percentile(hist, 0.95),
+                    p99_ms=percentile(hist, 0.99),
+                )
+            top.append(entry)
+    return top
+
+
+def flush():
+    """Log this invocation's top-N query summary and start a new invocation. Returns the summary."""
+    top = summary()
+    with _lock:
+        statements = sum(current["calls"] for current in _invocation.values())
+        total_ms = sum(current["ms"] for current in _invocation.values())
+        distinct = len(_invocation)
+        _invocation.clear()
+    if top:
+        granimals_log.info(
+            "🔎 Query summary", statements=statements, fingerprints=distinct,
+            ms=round(total_ms, 3), top=top
+        )
+    return top
+
+
+def container_stats():
+    """Copy of the container-wide histograms, keyed by fingerprint id."""
+    with _lock:
+        return {fp_id: dict(hist, buckets=list(hist["buckets"])) for fp_id, hist in _stats.items()}
+
+
+class QueryLogConnection(MinTimeLoggingConnection):
+    """
+    Pooled connection whose statements feed the fingerprint stats. Only
+    queries over DB_SLOW_QUERY_MS are logged individually, as with
+    MinTimeLoggingConnection, but every query is recorded.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initialize(granimals_log, SLOW_QUERY_MS)
+
+    def initialize(self, logobj, mintime=0):
+        super().initialize(logobj, mintime)
+        # Structured records instead of the text lines LoggingConnection writes
+        self.log = self._record
+
+    def _record(self, msg, curs):
+        if msg is None or getattr(curs, "timestamp", None) is None:
+            return
+        ms = (time.time() - curs.timestamp) * 1000
+        record(msg, ms, curs.rowcount)
+
+
+def connection_factory():
+    """connection_factory for the pool (the plain psycopg2 connection when DB_QUERY_STATS=0)."""
+    return QueryLogConnection if ENABLED else extensions.connection
+
+
+granimals_metrics.on_flush(flush)
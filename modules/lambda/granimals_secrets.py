@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import threading
+
+import boto3
+
+import granimals_log
+import granimals_metrics
+
+# ==========================================================
+# Secrets Manager cache shared by all handlers
+#
+# Every secret configured for this function is fetched in one batched call
+# while the module is imported (Lambda INIT), so the round trip stays off the
+# request path. Values are cached with a TTL and can be force-refreshed after
+# a rotation.
+# ==========================================================
+SECRETS_TTL = float(os.environ.get("SECRETS_TTL_SECONDS", 3600))
+REGION = os.environ.get("AWS_REGION", "ap-south-1")
+
+# logical name -> Secrets Manager id (name or ARN); only set ones are loaded
+SECRET_IDS = {
+    "rds": os.environ.get("RDS_SECRET_ARN"),
+    "openai": os.environ.get("OPENAI_SECRET_NAME") or os.environ.get("OPENAI_SECRET_ARN"),
+}
+
+_cache = {}  # name -> (value, fetched_at)
+_lock = threading.Lock()
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = boto3.client("secretsmanager", region_name=REGION)
+    return _client
+
+
+def _parse(resp):
+    if "SecretString" in resp:
+        val = resp["SecretString"]
+        try:
+            return json.loads(val)
+        except ValueError:
+            return val
+    binary = resp["SecretBinary"]
+    return binary.decode("utf-8") if isinstance(binary, bytes) else binary
+
+
+def _matches(secret_id, resp):
+    return secret_id in (resp.get("ARN"), resp.get("Name")) or resp.get("ARN", "").startswith(secret_id)
+
+
+def _fetch(names):
+    """Fetch the given logical secrets, batched when more than one is due."""
+    with granimals_metrics.span("secrets"):
+        return _fetch_uncached(names)
+
+
+def _fetch_uncached(names):
+    wanted = {name: SECRET_IDS[name] for name in names if SECRET_IDS.get(name)}
+    if not wanted:
+        return {}
+
+    client = _get_client()
+    fetched = {}
+    if len(wanted) > 1 and hasattr(client, "batch_get_secret_value"):
+        try:
+            resp = client.batch_get_secret_value(SecretIdList=list(wanted.values()))
+            for item in resp.get("SecretValues", []):
+                for name, secret_id in wanted.items():
+                    if _matches(secret_id, item):
+                        fetched[name] = _parse(item)
+            for err in resp.get("Errors", []):
+                granimals_log.warning("⚠️ Secret fetch error", name=err.get("SecretId"), code=err.get("ErrorCode"))
+        except Exception as e:
+            granimals_log.warning("⚠️ Batched secret fetch failed, falling back to single fetches", error=str(e))
+
+    for name, secret_id in wanted.items():
+        if name not in fetched:
+            fetched[name] = _parse(client.get_secret_value(SecretId=secret_id))
+
+    now = time.monotonic()
+    with _lock:
+        for name, value in fetched.items():
+            _cache[name] = (value, now)
+    return fetched
+
+
+def _is_fresh(name, now):
+    entry = _cache.get(name)
+    return entry is not None and now - entry[1] < SECRETS_TTL
+
+
+def preload(*names):
+    """Fetch every named secret (default: all configured ones) that is missing or expired."""
+    now = time.monotonic()
+    names = names or tuple(name for name, secret_id in SECRET_IDS.items() if secret_id)
+    due = [name for name in names if not _is_fresh(name, now)]
+    if due:
+        _fetch(due)
+
+
+def get(name, refresh=False):
+    """Return the cached value of a secret (dict for JSON secrets), or None if not configured."""
+    if not SECRET_IDS.get(name):
+        return None
+    if refresh or not _is_fresh(name, time.monotonic()):
+        _fetch([name])
+    return _cache[name][0]
+
+
+def invalidate(name=None):
+    """Drop one (or every) cached secret so the next get() refetches it."""
+    with _lock:
+        if name is None:
+            _cache.clear()
+        else:
+            _cache.pop(name, None)
+
+
+def rds_credentials(refresh=False):
+    """
+    psycopg2.connect() kwargs from the RDS secret; explicit DB_* env vars win
+    so local runs and the RDS Proxy endpoint can override the secret.
+    """
+    secret = get("rds", refresh=refresh) or {}
+    if not isinstance(secret, dict):
+        secret = {}
+    return {
+        "host": os.environ.get("DB_HOST") or secret.get("host") or "granimals-dev-cluster-1.cr82g6co4rta.ap-south-1.rds.amazonaws.com",
+        "port": int(os.environ.get("DB_PORT") or secret.get("port") or 5432),
+        "dbname": os.environ.get("DB_NAME") or secret.get("dbname") or "granimalsdev",
+        "user": os.environ.get("DB_USER") or secret.get("username"),
+        "password": os.environ.get("DB_PASS", secret.get("password")),
+    }
+
+
+def openai_key(refresh=False):
+    secret = get("openai", refresh=refresh)
+    if isinstance(secret, dict):
+        return secret.get("OPENAI_API_KEY") or secret.get("openai_api_key") or secret.get("api_key")
+    return secret
+
+
+# Warm the cache during INIT; a failure here is retried lazily on first use.
+try:
+    preload()
+except Exception:
+    granimals_log.exception("⚠️ Secret preload failed during INIT")
@@ -0,0 +1,147 @@
+import os
+import re
+import json
+from decimal import Decimal, InvalidOperation
+
+# ==========================================================
+# Quantity → grams for the food stats calculator
+#
+# Mass units convert directly; volume units go through the food's density
+# (g/ml) and "piece" through its piece weight (g). Both come, in order of
+# preference, from FOOD_OVERRIDES / AI_FOOD_UNIT_OVERRIDES, then from the
+# food's nutrient profile (the model estimates them), then DEFAULT_DENSITY
+# for volumes. A piece with no known weight cannot be converted.
+# ==========================================================
+MASS_GRAMS = {"mg": 0.001, "g": 1.0, "kg": 1000.0, "oz": 28.349523125, "lb": 453.59237}
+VOLUME_ML = {"ml": 1.0, "l": 1000.0, "tsp": 5.0, "tbsp": 15.0, "cup": 240.0}
+PIECE = "piece"
+
+UNIT_ALIASES = {
+    "milligram": "mg", "milligrams": "mg",
+    "grams": "g", "gram": "g", "gms": "g", "gm": "g", "gr": "g",
+    "kilogram": "kg", "kilograms": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg",
+    "ounce": "oz", "ounces": "oz",
+    "pound": "lb", "pounds": "lb", "lbs": "lb",
+    "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "liter": "l", "liters": "l", "litre": "l", "litres": "l", "ltr": "l",
+    "teaspoon": "tsp", "teaspoons": "tsp", "tsps": "tsp",
+    "tablespoon": "tbsp", "tablespoons": "tbsp", "tbsps": "tbsp", "tbs": "tbsp",
+    "cups": "cup",
+    "pieces": PIECE, "pcs": PIECE, "pc": PIECE, "whole": PIECE, "unit": PIECE, "units": PIECE,
+    "nos": PIECE, "no": PIECE,
+}
+
+DEFAULT_DENSITY = float(os.environ.get("AI_FOOD_DEFAULT_DENSITY", 1.0))  # water
+
+# Per-food density (g/ml) and piece weight (g) that win over the model's estimates
+FOOD_OVERRIDES = {
+    "banana": {"piece_grams": 118},
+    "apple": {"piece_grams": 182},
+    "orange": {"piece_grams": 131},
+    "egg": {"piece_grams": 50},
+    "boiled egg": {"piece_grams": 50},
+    "chapati": {"piece_grams": 40},
+    "roti": {"piece_grams": 40},
+    "idli": {"piece_grams": 39},
+    "bread": {"piece_grams": 28},
+    "milk": {"density": 1.03},
+    "water": {"density": 1.0},
+    "rice": {"density": 0.79},
+    "cooked rice": {"density": 0.79},
+    "oats": {"density": 0.34},
+    "sugar": {"density": 0.85},
+    "honey": {"density": 1.42},
+    "olive oil": {"density": 0.91},
+    "oil": {"density": 0.92},
+    "ghee": {"density": 0.91},
+    "butter": {"density": 0.96},
+    "flour": {"density": 0.53},
+    "yogurt": {"density": 1.03},
+    "curd": {"density": 1.03},
+}
+FOOD_OVERRIDES.update(json.loads(os.environ.get("AI_FOOD_UNIT_OVERRIDES") or "{}"))
+
+
+def normalize_text(value):
+    return re.sub(r"\s+", " ", str(value)).strip().lower()
+
+
+def normalize_unit(unit):
+    """Canonical spelling of a unit ("Tablespoons" → "tbsp"); unknown units come back normalised but unchanged."""
+    unit = normalize_text(unit).rstrip(".")
+    return UNIT_ALIASES.get(unit, unit)
+
+
+def parse_quantity(quantity):
+    """Decimal for a numeric quantity (also "1/2", "1 1/2"), None for anything else."""
+    text = normalize_text(quantity)
+    try:
+        whole, _, fraction = text.rpartition(" ") if "/" in text else ("", "", text)
+        if "/" in fraction:
+            numerator, denominator = fraction.split("/")
+            value = Decimal(numerator) / Decimal(denominator)
+        else:
+            value = Decimal(fraction)
+        if whole:
+            value += Decimal(whole)
+    except (InvalidOperation, ValueError, ZeroDivisionError):
+        return None
+    return value if value.is_finite() and value >= 0 else None
+
+
+def unit_kind(unit):
+    """ "mass", "volume", "piece" or None for a unit the engine doesn't know."""
+    unit = normalize_unit(unit)
+    if unit in MASS_GRAMS:
+        return "mass"
+    if unit in VOLUME_ML:
+        return "volume"
+    if unit == PIECE:
+        return "piece"
+    return None
+
+
+def food_override(food):
+    """Override entry for a (normalised) food name, trying a plain singular too."""
+    entry = FOOD_OVERRIDES.get(food)
+    if entry is None and food.endswith("s"):
+        entry = FOOD_OVERRIDES.get(food[:-1])
+    return entry or {}
+
+
+def _positive(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def to_grams(food, quantity, unit, profile=None):
+    """
+    Grams in quantity x unit of food. profile may supply density_g_per_ml
+    and piece_grams. Raises ValueError if the quantity or unit can't be converted.
+    """
+    amount = parse_quantity(quantity)
+    if amount is None:
+        raise ValueError(f"Quantity is not a number: {quantity!r}")
+    amount = float(amount)
+    unit = normalize_unit(unit)
+    override = food_override(food)
+    profile = profile or {}
+
+    if unit in MASS_GRAMS:
+        return amount * MASS_GRAMS[unit]
+    if unit in VOLUME_ML:
+        density = (
+            _positive(override.get("density"))
+            or _positive(profile.get("density_g_per_ml"))
+            or DEFAULT_DENSITY
+        )
+        return amount * VOLUME_ML[unit] * density
+    if unit == PIECE:
+        piece = _positive(override.get("piece_grams")) or _positive(profile.get("piece_grams"))
+        if piece is None:
+            raise ValueError(f"No piece weight known for '{food}'")
+        return amount * piece
+    raise ValueError(f"Unknown unit: {unit!r}")
@@ -1,115 +1,143 @@
-import boto3
 import json
-import os
-import psycopg2
-import traceback
+import granimals_db
+import granimals_http
+import granimals_log
+import granimals_metrics
 
+@granimals_metrics.handler
 def lambda_handler(event, context):
+    granimals_log.start(context)
     try:
         method = event.get("httpMethod", "POST")
-        print(f"HTTP Method: {method}")
-
-        creds = {
-            "host": "granimals-dev-cluster-1.cr82g6co4rta.ap-south-1.rds.amazonaws.com",
-            "port": 5432,
-            "dbname": "granimalsdev",
-            "username": "granimals_rds",
-            "password": "rdsSecret#1"
-        }
-
-        conn = psycopg2.connect(
-            host=creds['host'],
-            port=creds['port'],
-            dbname=creds['dbname'],
-            user=creds['username'],
-            password=creds['password']
-        )
-        cursor = conn.cursor()
-
-        if method == "POST":
-            # --- PUSH mode ---
-            body = json.loads(event.get('body', '{}'))
-            if 'diet_plan_id' in body:
-                insert_diet_plan(cursor, body)
-                conn.commit()
-                result = {"message": "Data inserted successfully"}
-            else:
-                result = {"error": "No diet_plan_id found in body"}
-
-        elif method == "GET":
-            # --- PULL mode ---
-            params = event.get("queryStringParameters") or {}
-            diet_plan_id = params.get("diet_plan_id")
-            if not diet_plan_id:
-                result = {"error": "diet_plan_id query parameter is required"}
-            else:
-                result = fetch_diet_plan(cursor, diet_plan_id)
-
-        cursor.close()
-        conn.close()
+        granimals_log.debug("📥 Incoming request", method=method)
 
-        return {
-            "statusCode": 200,
-            "body": json.dumps(result)
-        }
+        return granimals_db.run(lambda conn: handle_request(conn, method, event))
 
     except Exception as e:
-        traceback.print_exc()
+        granimals_log.exception("🔥 Fatal error in lambda_handler", method=event.get("httpMethod"))
         return {
             "statusCode": 500,
             "body": json.dumps({"error": str(e)})
         }
 
-# ------------------------
-# INSERT Functions (Push)
-# ------------------------
-def insert_diet_plan(cursor, data):
-    cursor.execute("""
-        INSERT INTO diet_plans (diet_plan_id, category, support_staff_id)
-        VALUES (%s, %s, %s)
-    """, (data['diet_plan_id'], data['category'], data['support_staff_id']))
+def handle_request(conn, method, event):
+    cursor = conn.cursor()
+    result = None
 
-    for week in data.get('weeks', []):
-        insert_diet_week(cursor, data['diet_plan_id'], week)
+    if method == "POST":
+        # --- PUSH mode ---
+        with granimals_metrics.span("parse"):
+            body = json.loads(granimals_http.request_body(event))
+        if 'diet_plan_id' in body:
+            inserted = insert_diet_plan(cursor, body)
+            conn.commit()
+            result = {"message": "Data inserted successfully", "inserted": inserted}
+        else:
+            result = {"error": "No diet_plan_id found in body"}
 
-def insert_diet_week(cursor, diet_plan_id, week):
-    cursor.execute("""
-        INSERT INTO diet_weeks (diet_week_id, diet_plan_id, week_number)
-        VALUES (%s, %s, %s)
-    """, (week['diet_week_id'], diet_plan_id, week['week_number']))
+    elif method == "GET":
+        # --- PULL mode ---
+        params = event.get("queryStringParameters") or {}
+        diet_plan_id = params.get("diet_plan_id")
+        if not diet_plan_id:
+            result = {"error": "diet_plan_id query parameter is required"}
+        else:
+            response = fetch_diet_plan_response(cursor, event, diet_plan_id, params.get("fetch_mode"))
+            cursor.close()
+            return response
 
-    for day in week.get('days', []):
-        insert_diet_day(cursor, week['diet_week_id'], day)
+    cursor.close()
+    return granimals_http.response(200, result, event=event)
 
-def insert_diet_day(cursor, diet_week_id, day):
-    cursor.execute("""
-        INSERT INTO diet_days (diet_day_id, diet_week_id, diet_day_name, date_assigned)
-        VALUES (%s, %s, %s, %s)
-    """, (day['diet_day_id'], diet_week_id, day['diet_day_name'], day['date_assigned']))
+def fetch_diet_plan_response(cursor, event, diet_plan_id, fetch_mode):
+    """GET response with an ETag; 304 when the client's copy is current."""
+    version = None
+    if granimals_http.get_header(event, "If-None-Match") or fetch_mode == "nested":
+        # Cheap check before building anything (the version is always read
+        # before the document, so an ETag can never claim newer data)
+        cursor.execute(DIET_PLAN_VERSION_SQL, {"diet_plan_id": diet_plan_id})
+        version = cursor.fetchone()[0]
+        etag = granimals_http.make_etag("diet_plan", diet_plan_id, fetch_mode, version)
+        if granimals_http.etag_matches(event, etag):
+            return granimals_http.not_modified(etag)
 
-    for meal in day.get('meals', []):
-        insert_diet_meal(cursor, day['diet_day_id'], meal)
+    if fetch_mode == "nested":
+        # Legacy query-per-level walk, kept for comparison
+        result = fetch_diet_plan(cursor, diet_plan_id)
+    else:
+        # Aggregated fetches come back from Postgres as ready-made JSON text
+        result, version = fetch_diet_plan_aggregated(cursor, diet_plan_id)
 
-def insert_diet_meal(cursor, diet_day_id, meal):
-    cursor.execute("""
+    if isinstance(result, dict) and "error" in result:
+        return granimals_http.response(200, result, event=event)
+    etag = granimals_http.make_etag("diet_plan", diet_plan_id, fetch_mode, version)
+    return granimals_http.response(200, result, etag=etag, event=event)
+
+# ------------------------
+# INSERT Functions (Push)
+# ------------------------
+# The whole plan goes to Postgres as one jsonb parameter and is expanded
+# set-wise into the four tables by a single statement: one round trip no
+# matter how many weeks/days/meals, and all-or-nothing since it is one
+# statement. Column types come from the tables' own row types via
+# jsonb_populate_record(set), so nothing here hard-codes them.
+INGEST_DIET_PLAN_SQL = """
+    WITH doc AS (
+        SELECT %s::jsonb AS plan
+    ), plan_rows AS (
+        INSERT INTO diet_plans (diet_plan_id, category, support_staff_id)
+        SELECT p.diet_plan_id, p.category, p.support_staff_id
+        FROM doc, jsonb_populate_record(NULL::diet_plans, doc.plan) p
+        RETURNING diet_plan_id
+    ), week_docs AS (
+        SELECT wk AS week, (jsonb_populate_record(NULL::diet_weeks, wk)).diet_week_id
+        FROM doc, jsonb_array_elements(coalesce(doc.plan->'weeks', '[]')) wk
+    ), week_rows AS (
+        INSERT INTO diet_weeks (diet_week_id, diet_plan_id, week_number)
+        SELECT w.diet_week_id, p.diet_plan_id, w.week_number
+        FROM plan_rows p, week_docs wd, jsonb_populate_record(NULL::diet_weeks, wd.week) w
+        RETURNING 1
+    ), day_docs AS (
+        SELECT wd.diet_week_id, dy AS day, (jsonb_populate_record(NULL::diet_days, dy)).diet_day_id
+        FROM week_docs wd, jsonb_array_elements(coalesce(wd.week->'days', '[]')) dy
+    ), day_rows AS (
+        INSERT INTO diet_days (diet_day_id, diet_week_id, diet_day_name, date_assigned)
+        SELECT d.diet_day_id, dd.diet_week_id, d.diet_day_name, d.date_assigned
+        FROM day_docs dd, jsonb_populate_record(NULL::diet_days, dd.day) d
+        RETURNING 1
+    ), meal_rows AS (
         INSERT INTO diet_meals (
             diet_day_id, meal_type, meal_id, meal_name,
             calories, proteins, fibers, fats,
             time_of_meal, status, notes
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """, (
-        diet_day_id,
-        meal.get('meal_type'),
-        meal.get('meal_id'),
-        meal.get('meal_name'),
-        meal.get('calories'),
-        meal.get('proteins'),
-        meal.get('Fibers') or meal.get('fibers'),
-        meal.get('fats'),
-        meal.get('time_of_meal'),
-        meal.get('status'),
-        json.dumps(meal.get('notes', []))
-    ))
+        )
+        SELECT dd.diet_day_id, m.meal_type, m.meal_id, m.meal_name,
+               m.calories, m.proteins, m.fibers, m.fats,
+               m.time_of_meal, m.status, m.notes
+        FROM day_docs dd,
+             jsonb_populate_recordset(NULL::diet_meals, coalesce(dd.day->'meals', '[]')) m
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM plan_rows),
+           (SELECT count(*) FROM week_rows),
+           (SELECT count(*) FROM day_rows),
+           (SELECT count(*) FROM meal_rows)
+"""
+
+def insert_diet_plan(cursor, data):
+    """Insert a full plan (weeks → days → meals) in one round trip; returns the row counts."""
+    with granimals_metrics.span("parse"):
+        for week in data.get('weeks', []):
+            for day in week.get('days', []):
+                for meal in day.get('meals', []):
+                    # Same normalisation the per-row inserts used to do
+                    meal['fibers'] = meal.get('Fibers') or meal.get('fibers')
+                    meal['notes'] = json.dumps(meal.get('notes', []))
+        document = json.dumps(data)
+
+    cursor.execute(INGEST_DIET_PLAN_SQL, (document,))
+    plans, weeks, days, meals = cursor.fetchone()
+    return {"diet_plans": plans, "diet_weeks": weeks, "diet_days": days, "diet_meals": meals}
 
 # ------------------------
 # FETCH Function (Pull)
@@ -193,3 +221,87 @@ def fetch_diet_plan(cursor, diet_plan_id):
         plan_dict["weeks"].append(week_dict)
 
     return plan_dict
+
+# Version token for a plan: the xmin of every row it is built from. Any
+# insert, update or delete under the plan changes the set.
+DIET_PLAN_VERSION_EXPR = """
+    md5(concat_ws('|',
+        (SELECT string_agg(vp.xmin::text, ',')
+         FROM diet_plans vp
+         WHERE vp.diet_plan_id = %(diet_plan_id)s),
+        (SELECT string_agg(vw.xmin::text, ',' ORDER BY vw.xmin::text)
+         FROM diet_weeks vw
+         WHERE vw.diet_plan_id = %(diet_plan_id)s),
+        (SELECT string_agg(vd.xmin::text, ',' ORDER BY vd.xmin::text)
+         FROM diet_days vd
+         JOIN diet_weeks vw ON vw.diet_week_id = vd.diet_week_id
+         WHERE vw.diet_plan_id = %(diet_plan_id)s),
+        (SELECT string_agg(vm.xmin::text, ',' ORDER BY vm.xmin::text)
+         FROM diet_meals vm
+         JOIN diet_days vd ON vd.diet_day_id = vm.diet_day_id
+         JOIN diet_weeks vw ON vw.diet_week_id = vd.diet_week_id
+         WHERE vw.diet_plan_id = %(diet_plan_id)s)
+    ))
+"""
+
+DIET_PLAN_VERSION_SQL = "SELECT " + DIET_PLAN_VERSION_EXPR
+
+# Whole plan document (weeks → days → meals) built by Postgres in a single
+# statement, together with its version token. json (not jsonb) keeps the keys in the same order as the
+# dicts built by fetch_diet_plan().
+FETCH_DIET_PLAN_SQL = """
+    SELECT json_build_object(
+        'diet_plan_id', p.diet_plan_id,
+        'category', p.category,
+        'support_staff_id', p.support_staff_id,
+        'weeks', coalesce(w.weeks, '[]')
+    )::text, """ + DIET_PLAN_VERSION_EXPR + """
+    FROM diet_plans p
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'diet_week_id', dw.diet_week_id,
+            'week_number', dw.week_number,
+            'days', coalesce(d.days, '[]')
+        ) ORDER BY dw.week_number) AS weeks
+        FROM diet_weeks dw
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                'diet_day_id', dd.diet_day_id,
+                'diet_day_name', dd.diet_day_name,
+                'date_assigned', dd.date_assigned,
+                'meals', coalesce(m.meals, '[]')
+            ) ORDER BY dd.date_assigned, dd.diet_day_name) AS days
+            FROM diet_days dd
+            LEFT JOIN LATERAL (
+                SELECT json_agg(json_build_object(
+                    'meal_type', dm.meal_type,
+                    'meal_id', dm.meal_id,
+                    'meal_name', dm.meal_name,
+                    'calories', dm.calories,
+                    'proteins', dm.proteins,
+                    'fibers', dm.fibers,
+                    'fats', dm.fats,
+                    'time_of_meal', dm.time_of_meal,
+                    'status', dm.status,
+                    'notes', coalesce(nullif(dm.notes::text, '')::json, '[]')
+                ) ORDER BY dm.time_of_meal) AS meals
+                FROM diet_meals dm
+                WHERE dm.diet_day_id = dd.diet_day_id
+            ) m ON true
+            WHERE dd.diet_week_id = dw.diet_week_id
+        ) d ON true
+        WHERE dw.diet_plan_id = p.diet_plan_id
+    ) w ON true
+    WHERE p.diet_plan_id = %(diet_plan_id)s
+"""
+
+def fetch_diet_plan_aggregated(cursor, diet_plan_id):
+    """
+    Same document as fetch_diet_plan() in one round trip. Returns
+    (JSON text, version token), or an error dict and None.
+    """
+    cursor.execute(FETCH_DIET_PLAN_SQL, {"diet_plan_id": diet_plan_id})
+    row = cursor.fetchone()
+    if not row:
+        return {"error": "Diet plan not found"}, None
+    return row[0], row[1]
@@ -25,7 +25,10 @@ def lambda_handler(event, context):
     # Parse JSON body if coming from API Gateway
     if isinstance(event, dict) and "body" in event:
         try:
-            event = json.loads(event["body"])
+            body = event["body"]
+            if event.get("isBase64Encoded"):  # binary media types are enabled on the API
+                body = base64.b64decode(body).decode("utf-8")
+            event = json.loads(body)
         except Exception:
             return {
                 'statusCode': 400,
@@ -164,6 +164,13 @@ resource "aws_iam_policy" "lambda_secretsmanager_policy" {
         Effect   = "Allow",
         Action   = ["secretsmanager:GetSecretValue"],
         Resource = var.rds_secret_arn
+      },
+      {
+        # BatchGetSecretValue has no resource-level permissions; each secret
+        # is still authorised through GetSecretValue above
+        Effect   = "Allow",
+        Action   = ["secretsmanager:BatchGetSecretValue"],
+        Resource = "*"
       }
     ]
   })
@@ -1,7 +1,17 @@
 import json
-import psycopg2
 import os
 import re
+import uuid
+import base64
+import hashlib
+import granimals_db
+import granimals_http
+import granimals_log
+import granimals_metrics
+import granimals_catalog
+import granimals_json
+from psycopg2 import sql
+from collections import OrderedDict
 from decimal import Decimal
 from datetime import datetime, date
 
@@ -30,158 +40,573 @@ def validate_identifier(identifier, name_type="identifier"):
 
 
 # ==========================================================
-# Main Lambda Handler
+# Streaming mode: server-side cursor + incremental encoding
 # ==========================================================
-def lambda_handler(event, context):
-    print("📥 Incoming event:", json.dumps(event))  # full payload log
+STREAM_ITERSIZE = int(os.environ.get("PULL_STREAM_ITERSIZE", 2000))
+# Lambda caps the synchronous response payload at 6 MB (6,291,456 bytes). The
+# body travels inside it as a JSON string, so the budget counts each row's
+# escaped size (every " and \ doubled, non-ASCII as \uXXXX), plus an
+# allowance for the proxy envelope: status code, headers, isBase64Encoded.
+MAX_RESPONSE_BYTES = int(os.environ.get("PULL_MAX_RESPONSE_BYTES", 5_500_000))
+RESPONSE_OVERHEAD_BYTES = 4096
+
+
+def stream_results(conn, query, params, limit=None, key_columns=0, order_terms=(), max_bytes=MAX_RESPONSE_BYTES):
+    """
+    Run the query on a named cursor (rows arrive itersize at a time) and
+    encode each row as it comes, so only one batch plus the encoded text is
+    ever in memory. Stops before the Lambda response carrying the body (as an
+    escaped JSON string) would exceed max_bytes, and says so;
+    with keyset pagination the cursor resumes right after the last row sent:
+
+        {"rows": [...], "row_count": n, "truncated": bool, "next_cursor": token | null}
+    """
+    cur = conn.cursor(name="pull_data_stream")
+    cur.itersize = STREAM_ITERSIZE
+    granimals_json.register_casts(cur)
+    cur.execute(query, tuple(params))
+
+    encode = None
+    envelope = len('{"rows": [], "row_count": , "truncated": false, "next_cursor": null}') * 2 + 20
+    size = envelope + RESPONSE_OVERHEAD_BYTES
+    parts = []
+    last_cursor = None
+    last_cursor_bytes = 0
+    truncated = False
+    has_more = False
+
+    # Encoding is interleaved with the batch fetches; those count as "fetch"
+    with granimals_metrics.span("serialize"):
+        for row in cur:
+            if encode is None:
+                encode = granimals_json.row_encoder(cur.description, key_columns, CustomJSONEncoder)
+            if limit is not None and len(parts) == limit:
+                has_more = True  # the extra LIMIT row
+                break
+            chunk = encode(row)
+            # Size once escaped into the response's "body" string
+            chunk_bytes = len(json.dumps(chunk)) - 2
+            # Room for the cursor that resumes after this row, in case it is the last one
+            cursor = cursor_bytes = None
+            if key_columns:
+                cursor = encode_cursor(order_terms, row[-key_columns:])
+                cursor_bytes = len(json.dumps(json.dumps(cursor))) - 2
+            if size + chunk_bytes + 2 + (cursor_bytes or 0) > max_bytes:
+                truncated = has_more = True
+                break
+            size += chunk_bytes + 2
+            parts.append(chunk)
+            last_cursor, last_cursor_bytes = cursor, cursor_bytes or 0
+
+    cur.close()
+    next_cursor = None
+    if has_more and last_cursor is not None:
+        next_cursor = last_cursor
+        size += last_cursor_bytes
+
+    granimals_log.info("✅ Streamed rows", rows=len(parts), bytes=size, truncated=truncated)
+    return (
+        '{"rows": [' + ", ".join(parts) + "], "
+        f'"row_count": {len(parts)}, "truncated": {"true" if truncated else "false"}, '
+        f'"next_cursor": {json.dumps(next_cursor)}}}'
+    )
+
+
+# ==========================================================
+# Keyset pagination helpers
+# ==========================================================
+MAX_PAGE_SIZE = int(os.environ.get("PULL_MAX_PAGE_SIZE", 10000))
+
+
+def parse_limit(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdigit():
+        raise ValueError(f"Invalid limit: {value}")
+    limit = int(value)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def parse_order_by(value):
+    """
+    order_by may be a single term or a list of them; a term is "column",
+    "column DESC" or {"column": ..., "direction": "asc" | "desc"}.
+    Returns [(column, "ASC" | "DESC"), ...]; identifiers are validated by the caller.
+    """
+    if value is None:
+        return []
+    terms = value if isinstance(value, list) else [value]
+    parsed = []
+    for term in terms:
+        if isinstance(term, dict):
+            column, direction = term.get("column"), term.get("direction", "ASC")
+        elif isinstance(term, str):
+            column, _, direction = term.strip().partition(" ")
+            direction = direction.strip() or "ASC"
+        else:
+            raise ValueError(f"Invalid order_by: {term}")
+        if not isinstance(column, str) or not isinstance(direction, str):
+            raise ValueError(f"Invalid order_by: {term}")
+        direction = direction.upper()
+        if direction not in ("ASC", "DESC"):
+            raise ValueError(f"Invalid order direction: {direction}")
+        parsed.append((column, direction))
+    return parsed
+
+
+def keyset_condition(order_refs, order_dirs):
+    """
+    (condition, slots) selecting rows strictly after the cursor's sort-key
+    values; slots[i] is the index of the key value bound to the i-th
+    placeholder. A single row comparison when every key sorts the same way
+    (index friendly); the expanded OR form when directions are mixed.
+    Sort keys should be NOT NULL and end in a unique column: comparisons with
+    NULL are never true, so NULL keys are not reachable past the first page.
+    """
+    if len(set(order_dirs)) == 1:
+        op = ">" if order_dirs[0] == "ASC" else "<"
+        condition = sql.SQL("({}) " + op + " ({})").format(
+            sql.SQL(", ").join(order_refs),
+            sql.SQL(", ").join([sql.Placeholder()] * len(order_refs))
+        )
+        return condition, list(range(len(order_refs)))
+
+    branches = []
+    slots = []
+    for i, (ref, direction) in enumerate(zip(order_refs, order_dirs)):
+        op = ">" if direction == "ASC" else "<"
+        terms = [sql.SQL("{} = %s").format(prev) for prev in order_refs[:i]]
+        terms.append(sql.SQL("{} " + op + " %s").format(ref))
+        branches.append(sql.SQL("(") + sql.SQL(" AND ").join(terms) + sql.SQL(")"))
+        slots.extend(range(i + 1))
+    return sql.SQL("(") + sql.SQL(" OR ").join(branches) + sql.SQL(")"), slots
+
+
+def _cursor_value(value):
+    # Exact text for anything JSON can't carry losslessly; Postgres casts the
+    # string parameter back to the column's type when comparing
+    if hasattr(value, "isoformat"):  # date, time, datetime
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def _order_signature(order_terms):
+    return hashlib.md5(",".join(order_terms).encode("utf-8")).hexdigest()[:8]
 
+
+def encode_cursor(order_terms, key_values):
+    """Opaque token holding the last row's sort-key values."""
+    payload = {"o": _order_signature(order_terms), "k": [_cursor_value(v) for v in key_values]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token, order_terms):
     try:
-        body = json.loads(event.get("body", "{}"))
-        print("📦 Parsed body:", body)
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        key_values = payload["k"]
+        signature = payload["o"]
+    except Exception:
+        raise ValueError("Invalid 'after' cursor")
+    if signature != _order_signature(order_terms) or len(key_values) != len(order_terms):
+        raise ValueError("'after' cursor does not match this query's order_by")
+    return key_values
 
-        query = None
-        params = []
 
-        # --------------------------------------------------
-        # Case 1: Single-table fallback
-        # --------------------------------------------------
-        if "table_name" in body:
-            print("🔎 Single-table query mode")
+# ==========================================================
+# Query compilation, memoized per request shape
+#
+# The shape of a request is everything that decides the SQL text: tables,
+# columns, join spec, filter/lookup keys, order_by, whether limit/after
+# are present and whether the result is streamed. Values only ever go in as parameters, so a repeated shape
+# reuses its compiled statement (identifiers already validated and quoted)
+# and just binds new values.
+# ==========================================================
+QUERY_CACHE_SIZE = int(os.environ.get("PULL_QUERY_CACHE_SIZE", 128))
 
-            table_name = validate_identifier(body.get("table_name"))
-            lookup_field = body.get("lookup_field")
-            lookup_value = body.get("lookup_value")
+_compiled = OrderedDict()  # shape -> compiled query, least recently used first
 
-            if lookup_field:
-                validate_identifier(lookup_field, "column")
-                query = f"SELECT * FROM {table_name} WHERE {lookup_field} = %s"
-                params = (lookup_value,)
-            else:
-                query = f"SELECT * FROM {table_name}"
-                params = ()
 
-        # --------------------------------------------------
-        # Case 2: Multi-table join mode
-        # --------------------------------------------------
-        elif "tables" in body and isinstance(body["tables"], list):
-            print("🔗 Multi-table query mode")
+def _ident(*names):
+    # Unquoted identifiers used to fold to lower case; keep that now they're quoted
+    return sql.Identifier(*(name.lower() for name in names))
 
-            tables = body["tables"]
-            joins = body.get("join", {})
 
-            select_parts = []
-            table_alias_map = {}
-            where_clauses = []
+def _freeze(value):
+    return tuple(value) if isinstance(value, list) else value
 
-            # Assign aliases and build column selections
-            for idx, tbl in enumerate(tables):
-                table_name = validate_identifier(tbl["name"], "table")
-                alias = f"t{idx+1}"
-                table_alias_map[table_name] = alias
 
-                cols = tbl.get("columns", ["*"])
-                if cols == ["*"]:
-                    select_parts.append(f"{alias}.*")
-                else:
-                    for col in cols:
-                        validate_identifier(col, "column")
-                        select_parts.append(f"{alias}.{col}")
-
-                # Add filters if any
-                filters = tbl.get("filters", {})
-                for col, val in filters.items():
-                    validate_identifier(col, "column")
-                    where_clauses.append(f"{alias}.{col} = %s")
-                    params.append(val)
-
-            # Build FROM + JOIN clauses
-            from_clause = ""
-            join_clauses = []
-
-            if joins and "on" in joins and joins["on"]:
-                print("🧩 Explicit join provided:", joins)
-
-                join_type = joins.get("type", "INNER").upper()
-                if join_type not in ("INNER", "LEFT", "RIGHT", "FULL", "CROSS"):
-                    raise ValueError(f"Invalid join type: {join_type}")
-
-                # First table is FROM
-                first_table = validate_identifier(tables[0]["name"], "table")
-                from_clause = f"{first_table} {table_alias_map[first_table]}"
-
-                for join in joins["on"]:
-                    lt = validate_identifier(join["left_table"], "table")
-                    lc = validate_identifier(join["left_column"], "column")
-                    rt = validate_identifier(join["right_table"], "table")
-                    rc = validate_identifier(join["right_column"], "column")
-
-                    left_alias = table_alias_map.get(lt)
-                    right_alias = table_alias_map.get(rt)
-                    if not left_alias or not right_alias:
-                        raise ValueError(f"Join table not in 'tables' list: {lt}, {rt}")
-
-                    if join_type == "CROSS":
-                        join_clause = f"CROSS JOIN {rt} {right_alias}"
-                    else:
-                        join_clause = (
-                            f"{join_type} JOIN {rt} {right_alias} "
-                            f"ON {left_alias}.{lc} = {right_alias}.{rc}"
-                        )
-                    join_clauses.append(join_clause)
-            else:
-                print("⚡ No join provided → using CROSS JOIN")
-                from_parts = []
-                for idx, tbl in enumerate(tables):
-                    table_name = validate_identifier(tbl["name"], "table")
-                    alias = f"t{idx+1}"
-                    from_parts.append(f"{table_name} {alias}")
-                from_clause = ", ".join(from_parts)
-
-            # Final query
-            query = f"SELECT {', '.join(select_parts)} FROM {from_clause} {' '.join(join_clauses)}"
-            if where_clauses:
-                query += f" WHERE {' AND '.join(where_clauses)}"
+def request_shape(body):
+    """
+    (shape, values): the hashable structural key of a request and the values
+    it binds, in placeholder order. (None, None) for an unrecognised body.
+    """
+    if "table_name" in body:
+        lookup_field = body.get("lookup_field") or None
+        shape = ("single", body.get("table_name"), _freeze(body.get("columns", ["*"])), lookup_field)
+        values = [body.get("lookup_value")] if lookup_field else []
 
+    elif "tables" in body and isinstance(body["tables"], list):
+        tables = tuple(
+            (tbl["name"], _freeze(tbl.get("columns", ["*"])), tuple(tbl.get("filters", {})))
+            for tbl in body["tables"]
+        )
+        joins = body.get("join", {})
+        join_spec = None
+        if joins and "on" in joins and joins["on"]:
+            join_spec = (joins.get("type", "INNER"), tuple(
+                (join["left_table"], join["left_column"], join["right_table"], join["right_column"])
+                for join in joins["on"]
+            ))
+        shape = ("multi", tables, join_spec)
+        values = [val for tbl in body["tables"] for val in tbl.get("filters", {}).values()]
+
+    else:
+        return None, None
+
+    order_by = tuple(parse_order_by(body.get("order_by")))
+    paging = (body.get("limit") is not None, body.get("after") is not None, bool(body.get("stream")))
+    return shape + (order_by,) + paging, values
+
+
+def compile_query(shape):
+    """
+    Validate every identifier in a request shape and build its statements as
+    psycopg2.sql objects. Returns a dict:
+
+        query / json_query      data statements (encoded here / by Postgres)
+        order_terms             "ref DIR" texts, for the cursor signature
+        key_columns             trailing sort-key columns to strip from rows
+        keyset_slots            cursor key value index for each keyset placeholder
+    """
+    mode, *spec, order_by, has_limit, has_after, stream = shape
+    where = []
+    join_clauses = []
+    referenced = {}  # table -> columns named by the request
+
+    if mode == "single":
+        table_name, columns, lookup_field = spec
+        table_name = validate_identifier(table_name)
+        if lookup_field:
+            where.append(sql.SQL("{} = %s").format(_ident(validate_identifier(lookup_field, "column"))))
+
+        if not isinstance(columns, tuple) or not columns:
+            raise ValueError("columns must be a non-empty list")
+        if columns == ("*",):
+            select = sql.SQL("{}.*").format(_ident(table_name))
         else:
-            print("❌ Invalid request format:", body)
-            return {"statusCode": 400, "body": json.dumps({"error": "Invalid request format"})}
-
-        print("📝 Final SQL Query:", query)
-        print("🔑 Query Params:", params)
+            select = sql.SQL(", ").join(_ident(validate_identifier(col, "column")) for col in columns)
+
+        from_clause = _ident(table_name)
+        order_names = [
+            ((table_name, validate_identifier(col, "column")), direction) for col, direction in order_by
+        ]
+        referenced[table_name] = [col for col in columns if col != "*"] + [names[1] for names, _ in order_names]
+        if lookup_field:
+            referenced[table_name].append(lookup_field)
+
+    else:
+        tables, join_spec = spec
+        if not tables:
+            raise ValueError("tables must be a non-empty list")
+
+        select_parts = []
+        from_parts = []
+        table_alias_map = {}
+
+        # Assign aliases and build column selections
+        for idx, (name, cols, filter_keys) in enumerate(tables):
+            table_name = validate_identifier(name, "table")
+            alias = f"t{idx+1}"
+            table_alias_map[table_name] = alias
+            used = referenced.setdefault(table_name, [])
+            from_parts.append(sql.SQL("{} {}").format(_ident(table_name), sql.Identifier(alias)))
+
+            if cols == ("*",):
+                select_parts.append(sql.SQL("{}.*").format(sql.Identifier(alias)))
+            else:
+                for col in cols:
+                    select_parts.append(_ident(alias, validate_identifier(col, "column")))
+                    used.append(col)
+
+            # Add filters if any
+            for col in filter_keys:
+                where.append(sql.SQL("{} = %s").format(_ident(alias, validate_identifier(col, "column"))))
+                used.append(col)
+
+        # Build FROM + JOIN clauses
+        if join_spec:
+            granimals_log.debug("🧩 Explicit join provided", join=join_spec)
+
+            join_type = join_spec[0].upper()
+            if join_type not in ("INNER", "LEFT", "RIGHT", "FULL", "CROSS"):
+                raise ValueError(f"Invalid join type: {join_type}")
+
+            # First table is FROM
+            from_clause = from_parts[0]
+
+            for lt, lc, rt, rc in join_spec[1]:
+                lt = validate_identifier(lt, "table")
+                lc = validate_identifier(lc, "column")
+                rt = validate_identifier(rt, "table")
+                rc = validate_identifier(rc, "column")
+
+                left_alias = table_alias_map.get(lt)
+                right_alias = table_alias_map.get(rt)
+                if not left_alias or not right_alias:
+                    raise ValueError(f"Join table not in 'tables' list: {lt}, {rt}")
+                referenced[lt].append(lc)
+                referenced[rt].append(rc)
+
+                if join_type == "CROSS":
+                    join_clause = sql.SQL("CROSS JOIN {} {}").format(_ident(rt), sql.Identifier(right_alias))
+                else:
+                    join_clause = sql.SQL(join_type + " JOIN {} {} ON {} = {}").format(
+                        _ident(rt), sql.Identifier(right_alias),
+                        _ident(left_alias, lc), _ident(right_alias, rc)
+                    )
+                join_clauses.append(join_clause)
+        else:
+            granimals_log.debug("⚡ No join provided → using CROSS JOIN")
+            from_clause = sql.SQL(", ").join(from_parts)
+
+        select = sql.SQL(", ").join(select_parts)
+        order_names = []
+        for ref, direction in order_by:
+            # "table.column" → alias.column
+            tbl, _, col = ref.partition(".")
+            alias = table_alias_map.get(validate_identifier(tbl, "table"))
+            if not alias or not col:
+                raise ValueError(f"order_by must be 'table.column' for a listed table: {ref}")
+            order_names.append(((alias, validate_identifier(col, "column")), direction))
+            referenced[tbl].append(col)
+
+    # Checked against the schema catalog: an unknown table or column is
+    # rejected here, without opening a connection
+    for table_name, cols in referenced.items():
+        granimals_catalog.require_columns(table_name, cols)
+
+    # --------------------------------------------------
+    # Ordering + keyset pagination (both modes)
+    # --------------------------------------------------
+    if has_after and not order_names:
+        raise ValueError("'after' requires 'order_by'")
+
+    order_refs = [_ident(*names) for names, _ in order_names]
+    order_dirs = [direction for _, direction in order_names]
+    keyset_slots = []
+    if has_after:
+        # Keyset, not OFFSET: deep pages cost the same as the first one
+        condition, keyset_slots = keyset_condition(order_refs, order_dirs)
+        where.append(condition)
+
+    from_sql = sql.SQL("FROM ") + from_clause
+    if join_clauses:
+        from_sql += sql.SQL(" ") + sql.SQL(" ").join(join_clauses)
+    if where:
+        from_sql += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(where)
+    if order_refs:
+        from_sql += sql.SQL(" ORDER BY ") + sql.SQL(", ").join(
+            sql.SQL("{} " + direction).format(ref) for ref, direction in zip(order_refs, order_dirs)
+        )
+    if has_limit:
+        # One extra row tells us whether there is a next page
+        from_sql += sql.SQL(" LIMIT %s")
+
+    # Sort-key values ride along as trailing columns so the next cursor
+    # can be built from the last row; they are stripped from the output.
+    # As text, so the cursor carries them exactly (NUMERIC arrives as float).
+    # A stream can stop at the size budget without a limit, so it needs them too
+    key_columns = len(order_refs) if has_limit or has_after or stream else 0
+    key_select = sql.Composed([
+        sql.SQL(", {}::text AS {}").format(ref, sql.Identifier(f"_keyset_{i}"))
+        for i, ref in enumerate(order_refs[:key_columns])
+    ])
+
+    # db_json: Postgres renders the JSON. A plain result is aggregated into
+    # one array; a page comes back as one JSON text per row (the sort keys
+    # stay out of it, next to it) for the handler to join
+    query = sql.SQL("SELECT ") + select + key_select + sql.SQL(" ") + from_sql
+    if has_limit or has_after:
+        json_query = (
+            sql.SQL("SELECT (SELECT to_json(r) FROM (SELECT ") + select + sql.SQL(") r)::text")
+            + key_select + sql.SQL(" ") + from_sql
+        )
+    else:
+        json_query = sql.SQL("SELECT coalesce(json_agg(q), '[]')::text FROM ({}) q").format(
+            sql.SQL("SELECT ") + select + sql.SQL(" ") + from_sql
+        )
 
-        # --------------------------------------------------
-        # Database connection
-        # --------------------------------------------------
-        creds = {
-            "host": "granimals-dev-cluster-1.cr82g6co4rta.ap-south-1.rds.amazonaws.com",
-            "port": 5432,
-            "dbname": "granimalsdev",
-            "username": "granimals_rds",
-            "password": "rdsSecret#1"
+    return {
+        "query": query,
+        "json_query": json_query,
+        "order_terms": [f"{'.'.join(names)} {direction}" for names, direction in order_names],
+        "key_columns": key_columns,
+        "keyset_slots": keyset_slots,
+    }
+
+
+def get_compiled(shape):
+    """compile_query(shape) through a bounded LRU (PULL_QUERY_CACHE_SIZE shapes)."""
+    compiled = _compiled.get(shape)
+    if compiled is not None:
+        _compiled.move_to_end(shape)
+        return compiled
+
+    granimals_log.info("🧱 Compiling query for a new request shape", cached_shapes=len(_compiled))
+    compiled = compile_query(shape)
+    _compiled[shape] = compiled
+    while len(_compiled) > QUERY_CACHE_SIZE:
+        _compiled.popitem(last=False)
+    return compiled
+
+
+def render(compiled, conn):
+    """
+    {"query", "json_query"} as SQL text. Quoting identifiers
+    needs a connection, so this happens once per shape.
+    """
+    if "sql" not in compiled:
+        compiled["sql"] = {
+            name: compiled[name].as_string(conn) for name in ("query", "json_query")
         }
+    return compiled["sql"]
 
-        print("🌐 Connecting to DB:", creds["host"], creds["dbname"])
-        conn = psycopg2.connect(
-            host=creds["host"],
-            port=creds["port"],
-            dbname=creds["dbname"],
-            user=creds["username"],
-            password=creds["password"]
-        )
-        cur = conn.cursor()
 
-        print("▶️ Executing query...")
-        cur.execute(query, tuple(params))
+def bind_params(compiled, values, key_values, limit):
+    """Parameters for a compiled query, in placeholder order."""
+    params = list(values)
+    params.extend(key_values[i] for i in compiled["keyset_slots"])
+    if limit is not None:
+        params.append(limit + 1)
+    return params
+
+
+# ==========================================================
+# Response body for a non-streamed request
+# ==========================================================
+def fetch_body(cur, compiled, params, limit=None, paginated=False, db_json=False):
+    """
+    Run a compiled (and rendered) query and return the response body text:
+    a JSON array, or {"rows": [...], "next_cursor": token | null} when
+    paginated. With db_json the rows are rendered to JSON by Postgres and
+    Python only joins text; without it they are encoded here.
+    """
+    key_columns = compiled["key_columns"]
+    if db_json:
+        granimals_db.execute_prepared(cur, compiled["sql"]["json_query"], tuple(params))
+        if not paginated:
+            body = cur.fetchone()[0]
+            cur.close()
+            granimals_log.info("✅ Query executed, JSON rendered by the database", chars=len(body))
+            return body
+        rows = cur.fetchall()
+        encode = lambda row: row[0]  # already JSON text
+    else:
+        # Rows come back JSON-ready (NUMERIC as float, dates/times as ISO
+        # text, json/jsonb as raw text): almost no per-cell allocations
+        granimals_json.register_casts(cur)
+        granimals_db.execute_prepared(cur, compiled["sql"]["query"], tuple(params))
         rows = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
+        encode = granimals_json.row_encoder(cur.description, key_columns, CustomJSONEncoder)
+    cur.close()
+    granimals_log.info("✅ Query executed", rows=len(rows))
+
+    with granimals_metrics.span("serialize"):
+        if not paginated:
+            return "[" + ", ".join(map(encode, rows)) + "]"
+
+        # Paginated: {"rows": [...], "next_cursor": token | null}
+        has_more = limit is not None and len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+        next_cursor = None
+        if has_more and key_columns:
+            next_cursor = encode_cursor(compiled["order_terms"], rows[-1][-key_columns:])
+        body = '{"rows": [' + ", ".join(map(encode, rows)) + "]"
+        return body + f', "next_cursor": {json.dumps(next_cursor)}}}'
 
-        cur.close()
-        conn.close()
-        print("✅ Query executed successfully, rows fetched:", len(rows))
 
-        results = [dict(zip(colnames, row)) for row in rows]
-        return {"statusCode": 200, "body": json.dumps(results, cls=CustomJSONEncoder)}
+# ==========================================================
+# Main Lambda Handler
+# ==========================================================
+@granimals_metrics.handler
+def lambda_handler(event, context):
+    granimals_log.start(context)
+    granimals_log.debug("📥 Incoming event", event=event)
+
+    try:
+        # Request → compiled query + bound parameters. A ValueError here is
+        # the client's (bad limit, cursor, order_by, unknown column): 400
+        try:
+            with granimals_metrics.span("parse"):
+                body = json.loads(granimals_http.request_body(event))
+                granimals_log.debug("📦 Parsed body", body=body)
+
+                shape, values = request_shape(body)
+                if shape is None:
+                    granimals_log.warning("❌ Invalid request format", body=body)
+                    return {"statusCode": 400, "body": json.dumps({"error": "Invalid request format"})}
+                granimals_log.debug("🔎 Single-table query mode" if shape[0] == "single" else "🔗 Multi-table query mode")
+
+                stream = bool(body.get("stream"))
+                db_json = bool(body.get("db_json"))
+                if stream and db_json:
+                    raise ValueError("'db_json' can't be combined with 'stream'")
+
+                compiled = get_compiled(shape)
+                order_terms = compiled["order_terms"]
+                key_columns = compiled["key_columns"]
+
+                limit = parse_limit(body.get("limit"))
+                after = body.get("after")
+                key_values = decode_cursor(after, order_terms) if after is not None else ()
+                params = bind_params(compiled, values, key_values, limit)
+                granimals_log.debug("🔑 Query params", params=params)
+        except ValueError as e:
+            error_msg = str(e)
+            granimals_log.warning("❌ Invalid request", error=error_msg)
+            return {"statusCode": 400, "body": json.dumps({"error": error_msg})}
+
+        # --------------------------------------------------
+        # Database query (warm connection reused across invocations)
+        # --------------------------------------------------
+        granimals_metrics.set_property("mode", "stream" if stream else "db_json" if db_json else "rows")
+
+        def run_query(conn):
+            texts = render(compiled, conn)
+            query = texts["json_query" if db_json else "query"]
+            granimals_log.debug("📝 Final SQL query", query=query)
+            if stream:
+                granimals_log.debug("▶️ Streaming query through a server-side cursor")
+                return stream_results(conn, query, params, limit, key_columns, order_terms)
+
+            granimals_log.debug("▶️ Executing query")
+            paginated = limit is not None or after is not None
+            return fetch_body(conn.cursor(), compiled, params, limit, paginated, db_json)
+
+        response_body = granimals_db.run(run_query)
+
+        # ETag hashed from the body: the query has already run and the rows
+        # are encoded, so a matching If-None-Match saves only the transfer.
+        # Streamed pages are sized to the response limit and go out without one.
+        etag = None
+        if not stream:
+            etag = granimals_http.make_etag(response_body)
+            if granimals_http.etag_matches(event, etag):
+                granimals_log.info("✅ Client copy is current, returning 304")
+                return granimals_http.not_modified(etag)
+
+        return granimals_http.response(200, response_body, etag=etag, event=event)
 
     except Exception as e:
-        print("💥 ERROR in Lambda:", str(e))
+        granimals_log.exception("💥 ERROR in Lambda")
+        if granimals_catalog.is_schema_error(e):
+            # Postgres knows better than the cached catalog: reload it and
+            # recompile affected shapes on the next request
+            granimals_catalog.invalidate()
+            _compiled.clear()
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
@@ -1,14 +1,18 @@
 import json
-import psycopg2
-import os
-import traceback
+import granimals_db
+import granimals_http
+import granimals_log
+import granimals_metrics
 
+@granimals_metrics.handler
 def lambda_handler(event, context):
+    granimals_log.start(context)
     try:
-        print("📥 Incoming event:", event)
+        granimals_log.debug("📥 Incoming event", event=event)
 
         # Handle API Gateway or direct invoke
-        body = json.loads(event.get("body", "{}")) if isinstance(event, dict) else event
+        with granimals_metrics.span("parse"):
+            body = json.loads(granimals_http.request_body(event)) if isinstance(event, dict) else event
         client_id = body.get("client_id")
 
         if not client_id:
@@ -17,32 +21,27 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "client_id is required"})
             }
 
-        # DB connection
-        conn = psycopg2.connect(
-            host=os.environ.get("DB_HOST", "granimals-dev-cluster-1.cr82g6co4rta.ap-south-1.rds.amazonaws.com"),
-            port=int(os.environ.get("DB_PORT", 5432)),
-            dbname=os.environ.get("DB_NAME", "granimalsdev"),
-            user=os.environ.get("DB_USER", "granimals_rds"),
-            password=os.environ.get("DB_PASS", "rdsSecret#1")
-        )
-        cur = conn.cursor()
-
         query = """
             SELECT id, client_id, gender_identity, birthdate, height, height_unit,
                    height_accuracy, weight, weight_unit, preferred_workout_time,
                    sleep_time, wake_up_time, breakfast_time, lunch_time, dinner_time,
-                   snack_frequency, creation_date_time
+                   snack_frequency, creation_date_time,
+                   xmin::text AS row_version
             FROM onboarding_questionnaire
             WHERE client_id = %s
             ORDER BY creation_date_time DESC
             LIMIT 1
         """
 
-        cur.execute(query, (client_id,))
-        row = cur.fetchone()
+        def fetch_latest(conn):
+            cur = conn.cursor()
+            cur.execute(query, (client_id,))
+            row = cur.fetchone()
+            cur.close()
+            return row
 
-        cur.close()
-        conn.close()
+        # Warm connection reused across invocations
+        row = granimals_db.run(fetch_latest)
 
         if not row:
             return {
@@ -50,6 +49,13 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "No onboarding responses found for this client_id"})
             }
 
+        # The latest row's id + xmin changes whenever a newer answer is
+        # saved or that row is edited, so it doubles as the ETag
+        *row, row_version = row
+        etag = granimals_http.make_etag("onboarding", client_id, row[0], row_version)
+        if granimals_http.etag_matches(event, etag):
+            return granimals_http.not_modified(etag)
+
         # Convert row → dict
         col_names = [
             "id", "client_id", "gender_identity", "birthdate", "height", "height_unit",
@@ -57,17 +63,14 @@ def lambda_handler(event, context):
             "sleep_time", "wake_up_time", "breakfast_time", "lunch_time", "dinner_time",
             "snack_frequency", "creation_date_time"
         ]
-        result = dict(zip(col_names, row))
+        with granimals_metrics.span("serialize"):
+            result = json.dumps(dict(zip(col_names, row)), default=str)  # default=str handles DATE/TIME
 
-        return {
-            "statusCode": 200,
-            "body": json.dumps(result, default=str)  # default=str handles DATE/TIME
-        }
+        return granimals_http.response(200, result, etag=etag, event=event)
 
     except Exception as e:
         error_msg = str(e)
-        print("🔥 Fatal error in lambda_handler:", error_msg)
-        print("🔍 Traceback:", traceback.format_exc())
+        granimals_log.exception("🔥 Fatal error in lambda_handler")
         return {
             "statusCode": 500,
             "body": json.dumps({"error": error_msg})